@@ -99,14 +99,28 @@
     } catch (_) {}
 
     // Für jedes Home den travel_times Status laden
+    // Bevorzugt aus der Matrix (ein Download für alle Homes), sonst home_<id>.json
+    const matrix = (window.HomeTravelTimes && typeof window.HomeTravelTimes.loadMatrix === "function")
+      ? await window.HomeTravelTimes.loadMatrix()
+      : null;
+
     await Promise.all(homes.map(async (h) => {
       h.travelTimesStatus = "none"; // none, partial, full
       h.travelTimesCount = 0;
       try {
-        const ttResp = await fetch(`${travelTimesDir}/home_${h.id}.json`, { cache: "no-store" });
-        if (ttResp.ok) {
-          const ttData = await ttResp.json();
-          const count = Object.keys(ttData).length;
+        let count = null;
+        const row = matrix ? matrix.homes.indexOf(h.id) : -1;
+        if (row >= 0) {
+          const n = matrix.resorts.length;
+          count = 0;
+          for (const sec of matrix.seconds.subarray(row * n, (row + 1) * n)) {
+            if (sec !== matrix.missing) count++;
+          }
+        } else {
+          const ttResp = await fetch(`${travelTimesDir}/home_${h.id}.json`, { cache: "no-store" });
+          if (ttResp.ok) count = Object.keys(await ttResp.json()).length;
+        }
+        if (count !== null) {
           h.travelTimesCount = count;
           if (totalResorts > 0) {
             const pct = count / totalResorts;
@@ -2,7 +2,9 @@
 // Loads precomputed travel times per home profile (for the time slider + popup drive text).
 //
 // Expected files:
-// - data/travel_times/home_<homeId>.json
+// - data/travel_times/matrix.json + matrix.bin (preferred, build_travel_time_matrix.py)
+//   all homes in one uint16 home x resort matrix; switching homes is an array view
+// - data/travel_times/home_<homeId>.json (fallback, homes not in the matrix)
 //   format: { "<Resort Name>": { "hours": 2.15, "km": 180.2 }, ... }
 //
 // This module is safe to call before resorts are loaded; it will apply once resorts are ready.
@@ -11,6 +13,9 @@
   const mod = {};
   const cache = {}; // homeId -> ttMap
   let pendingHomeId = null;
+  let matrixPromise = null;
+
+  const MATRIX_URL = "data/travel_times/matrix.json";
 
   const STORAGE_KEY = "skimap.selectedHomeId";
   const DEFAULT_HOME = "muc";
@@ -30,6 +35,46 @@
     return r.json();
   }
 
+  // Loads header + binary once; resolves to null if the matrix is not available
+  function loadMatrix() {
+    if (!matrixPromise) {
+      matrixPromise = (async () => {
+        const header = await fetchJson(MATRIX_URL);
+        const binUrl = MATRIX_URL.replace(/[^/]+$/, header.data_file);
+        const r = await fetch(binUrl, { cache: "no-cache" });
+        if (!r.ok) throw new Error(`Failed to load ${binUrl}: ${r.status}`);
+        const buf = await r.arrayBuffer();
+        const size = header.homes.length * header.resorts.length;
+        // uint16 little-endian; all supported browsers are little-endian
+        header.seconds = new Uint16Array(buf, 0, size);
+        header.distances = new Uint16Array(buf, size * 2, size);
+        return header;
+      })().catch(err => {
+        console.warn("Travel time matrix not available, using per-home JSON:", err.message);
+        return null;
+      });
+    }
+    return matrixPromise;
+  }
+
+  // Row of the matrix as ttMap ({ stable_id: { duration_min, distance_km } })
+  function mapFromMatrix(matrix, homeId) {
+    const idx = matrix.homes.indexOf(homeId);
+    if (idx < 0) return null;
+    const n = matrix.resorts.length;
+    const sec = matrix.seconds.subarray(idx * n, (idx + 1) * n);
+    const dist = matrix.distances.subarray(idx * n, (idx + 1) * n);
+    const ttMap = {};
+    for (let i = 0; i < n; i++) {
+      if (sec[i] === matrix.missing) continue;
+      ttMap[matrix.resorts[i]] = {
+        duration_min: sec[i] / 60,
+        distance_km: dist[i] === matrix.missing ? null : dist[i] / matrix.distance_scale
+      };
+    }
+    return ttMap;
+  }
+
   function applyIfReady(homeId, ttMap) {
     // resorts may not be loaded yet
     const ready = !!window.__resortsReady;
@@ -45,6 +90,7 @@
 
   mod.getSelectedHomeId = getSelectedHomeId;
   mod.setSelectedHomeId = setSelectedHomeId;
+  mod.loadMatrix = loadMatrix;
 
   mod.load = async function load(homeId) {
     const hid = homeId || getSelectedHomeId();
@@ -54,8 +100,8 @@
       return cache[hid];
     }
 
-    const url = `data/travel_times/home_${hid}.json`;
-    const data = await fetchJson(url);
+    const matrix = await loadMatrix();
+    const data = (matrix && mapFromMatrix(matrix, hid)) || await fetchJson(`data/travel_times/home_${hid}.json`);
 
     cache[hid] = data;
     applyIfReady(hid, data);
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Blend GeoSphere (hourly, 61h) and Open-Meteo (daily, 16d) into one per-resort product.
+
+The frontend used to load both current_forecast.json and openmeteo_forecast.json
+and reconcile them itself (48h slice, sumSnow reducers, provider fallback).
+This stage does that once in the pipeline:
+
+- Near term from GeoSphere (hourly, higher resolution), Open-Meteo beyond it.
+  Open-Meteo days only contribute the fraction that lies after now and
+  outside the GeoSphere window (the past part of today is not counted).
+- GeoSphere hours before the current hour are dropped (entries deferred by
+  --priority can be up to 61h old); if the remaining hours end inside the
+  24h/48h window, Open-Meteo fills the rest.
+- GeoSphere has no elevation parameter; per elevation, hourly precipitation
+  counts as snow only where the GeoSphere snow limit is below that elevation.
+- Precomputed snow sums per elevation for 24h / 48h / 3d / 7d / 16d.
+- Compact column-oriented daily series and 6h blocks for the popup tables.
+
+index.html only loads this file (the two provider files stay in the repo as
+inputs for the next fetcher run).
+
+Usage:
+    python build_blended_forecast.py
+
+Input:
+    data/forecasts/current_forecast.json    (fetch_geosphere_forecast.py)
+    data/forecasts/openmeteo_forecast.json  (fetch_openmeteo_forecast.py)
+
+Output:
+    data/forecasts/blended_forecast.json
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from pipeline_utils import write_json_atomic
+
+# ==============================================================================
+# Configuration
+# ==============================================================================
+
+FORECAST_DIR = Path(__file__).parent.parent.parent / "data" / "forecasts"
+
+OPENMETEO_TZ = ZoneInfo("Europe/Berlin")   # Timezone of Open-Meteo daily dates
+NEAR_TERM_HOURS = 48                       # Hours taken from GeoSphere
+BLOCK_HOURS = 6                            # GeoSphere table granularity
+
+# Snow sum windows: (label, hours from GeoSphere, Open-Meteo days)
+SNOW_WINDOWS = [
+    ("24h", 24, 1),
+    ("48h", 48, 2),
+    ("3d", None, 3),
+    ("7d", None, 7),
+    ("16d", None, 16),
+]
+
+SNOW_CM_PER_MM = 1.0   # Snow at elevation from GeoSphere precipitation (~10:1)
+
+# ==============================================================================
+# Loading
+# ==============================================================================
+
+def load_forecast_file(path: Path) -> tuple[dict, str | None]:
+    """Load a forecast JSON, returns (forecasts, generated_at)."""
+    if not path.exists():
+        print(f"Warning: {path} not found")
+        return {}, None
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('forecasts', {}), data.get('generated_at')
+
+
+def parse_timestamp(ts: str) -> datetime:
+    """Parse a GeoSphere timestamp (e.g. 2026-01-17T06:00+00:00)."""
+    return datetime.fromisoformat(ts.replace('Z', '+00:00'))
+
+
+# ==============================================================================
+# Blending
+# ==============================================================================
+
+def geosphere_snow_at(hour: dict, elevation_m: int | None) -> float:
+    """Hourly snow (cm) at an elevation, using the GeoSphere snow limit."""
+    snowfall = hour.get('snowfall_cm') or 0
+    if elevation_m is None:
+        return snowfall
+    snow_limit = hour.get('snow_limit_m')
+    if snow_limit is not None and snow_limit > elevation_m:
+        return 0.0
+    precip_snow = (hour.get('precip_mm') or 0) * SNOW_CM_PER_MM
+    return max(snowfall, precip_snow)
+
+
+def day_coverage(day_start: datetime, start: datetime, end: datetime) -> float:
+    """Fraction of an Open-Meteo day within [start, end) (e.g. the GeoSphere window)."""
+    day_end = day_start + timedelta(days=1)
+    overlap = (min(day_end, end) - max(day_start, start)).total_seconds()
+    return max(0.0, overlap) / 86400
+
+
+def drop_past_hours(hourly: list, now: datetime) -> list:
+    """GeoSphere records from the current hour on."""
+    hour_start = now.replace(minute=0, second=0, microsecond=0)
+    return [h for h in hourly if parse_timestamp(h['timestamp']) >= hour_start]
+
+
+def blend_snow_sums(hourly: list, daily: list, elevation_m: int | None, now: datetime) -> list:
+    """
+    Snow sums for all SNOW_WINDOWS at one elevation, counted from the current hour.
+
+    GeoSphere hours inside the window count fully. Each Open-Meteo day counts
+    with the fraction of it that lies in [now, window end) and outside the
+    GeoSphere window, so neither the past part of today nor hours GeoSphere
+    already covers are added again.
+
+    Args:
+        hourly: GeoSphere hourly records from now on (may be empty)
+        daily: Open-Meteo daily records (may be empty)
+        elevation_m: Elevation for the GeoSphere snow limit check
+        now: Blend time (window start is the start of its hour)
+
+    Returns:
+        List of sums (cm, 1 decimal) aligned with SNOW_WINDOWS
+    """
+    window_start = now.replace(minute=0, second=0, microsecond=0)
+    near = hourly[:NEAR_TERM_HOURS]
+    gs_snow = [geosphere_snow_at(h, elevation_m) for h in near]
+    gs_times = [parse_timestamp(h['timestamp']) for h in near]
+
+    gs_start = gs_end = None
+    if near:
+        gs_start = gs_times[0]
+        gs_end = gs_times[-1] + timedelta(hours=1)
+
+    day_starts = [
+        datetime.fromisoformat(d['date']).replace(tzinfo=OPENMETEO_TZ)
+        for d in daily
+    ]
+
+    sums = []
+    for _, hours, days in SNOW_WINDOWS:
+        if hours is not None:
+            window_end = window_start + timedelta(hours=hours)
+        elif day_starts:
+            window_end = day_starts[min(days, len(day_starts)) - 1] + timedelta(days=1)
+        else:
+            # GeoSphere only (FR/IT never, AT/DE/CH/SI if Open-Meteo failed): 48h as best guess
+            window_end = gs_end or window_start
+
+        total = sum(snow for t, snow in zip(gs_times, gs_snow) if t < window_end)
+        for d, day_start in zip(daily, day_starts):
+            share = day_coverage(day_start, window_start, window_end)
+            if gs_start is not None:
+                share -= day_coverage(day_start, max(window_start, gs_start), min(window_end, gs_end))
+            if share > 0:
+                total += (d.get('snowfall_cm') or 0) * share
+        sums.append(round(total, 1))
+    return sums
+
+
+def compact_daily(daily: list) -> dict:
+    """Column-oriented daily series for the popup table (consecutive days from 'start')."""
+    return {
+        'start': daily[0]['date'] if daily else None,
+        'snow': [d.get('snowfall_cm') for d in daily],
+        'tmin': [d.get('temp_min') for d in daily],
+        'tmax': [d.get('temp_max') for d in daily],
+        'code': [d.get('weathercode') for d in daily],
+    }
+
+
+def geosphere_blocks(hourly: list, elevation_m: int | None) -> dict | None:
+    """
+    6h blocks (snow sum, mean temp) over the near-term window.
+
+    Snow uses the same elevation-adjusted values as the mountain snow sums,
+    so the popup's 24h/48h summary matches its block rows.
+    """
+    near = hourly[:NEAR_TERM_HOURS]
+    if not near:
+        return None
+    snow, temp = [], []
+    for i in range(0, len(near), BLOCK_HOURS):
+        block = near[i:i + BLOCK_HOURS]
+        snow.append(round(sum(geosphere_snow_at(h, elevation_m) for h in block), 1))
+        temps = [h['temp_2m'] for h in block if h.get('temp_2m') is not None]
+        temp.append(round(sum(temps) / len(temps)) if temps else None)
+    return {'start': near[0]['timestamp'], 'hours': BLOCK_HOURS, 'snow': snow, 'temp': temp}
+
+
+def blend_resort(gs: dict | None, om: dict | None, now: datetime) -> dict:
+    """Build the blended entry for one resort."""
+    hourly = drop_past_hours((gs or {}).get('forecasts') or [], now)
+    entry = {
+        'name': (om or gs or {}).get('name'),
+        'src': ''.join(s for s, present in (('g', bool(hourly)), ('o', bool(om))) if present),
+    }
+
+    for location_type in ('mountain', 'valley'):
+        loc = (om or {}).get(location_type)
+        if not loc and not (location_type == 'mountain' and hourly):
+            continue
+        daily = (loc or {}).get('daily') or []
+        elevation = (loc or {}).get('elevation_m')
+        entry[location_type] = {
+            'elevation_m': elevation,
+            'snow': blend_snow_sums(hourly, daily, elevation, now),
+            'daily': compact_daily(daily),
+        }
+        if (loc or {}).get('stale'):
+            # Carried forward from an earlier Open-Meteo run (carry_forward_forecasts)
+            entry[location_type]['stale'] = True
+            entry[location_type]['fetched_at'] = loc.get('fetched_at')
+
+    # Values the map badges use (previously computed in getSnowSummary)
+    temps = [h['temp_2m'] for h in hourly if h.get('temp_2m') is not None]
+    temps += [
+        d['temp_min'] for d in ((om or {}).get('mountain') or {}).get('daily', [])[:7]
+        if d.get('temp_min') is not None
+    ]
+    snow_limits = [
+        h['snow_limit_m'] for h in hourly
+        if h.get('snow_limit_m') is not None and (h.get('snowfall_cm') or 0) > 0
+    ]
+    current_limits = [h['snow_limit_m'] for h in hourly[:BLOCK_HOURS] if h.get('snow_limit_m') is not None]
+    entry['min_temp'] = round(min(temps)) if temps else None
+    entry['snow_limit_m'] = min(snow_limits) if snow_limits else None
+    entry['snow_limit_now_m'] = current_limits[0] if current_limits else None
+
+    blocks = geosphere_blocks(hourly, entry.get('mountain', {}).get('elevation_m'))
+    if blocks:
+        entry['blocks'] = blocks
+    return entry
+
+
+def build_blended_output(gs_forecasts: dict, gs_generated: str | None,
+                         om_forecasts: dict, om_generated: str | None) -> dict:
+    """Blend all resorts into the blended_forecast.json structure."""
+    now = datetime.now(timezone.utc)
+    blended = {}
+    for stable_id in sorted(set(gs_forecasts) | set(om_forecasts)):
+        blended[stable_id] = blend_resort(gs_forecasts.get(stable_id), om_forecasts.get(stable_id), now)
+
+    return {
+        "generated_at": now.isoformat(),
+        "sources": {
+            "geosphere": gs_generated,
+            "openmeteo": om_generated,
+        },
+        "windows": [label for label, _, _ in SNOW_WINDOWS],
+        "forecasts": blended,
+    }
+
+
+# ==============================================================================
+# Main
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Blend GeoSphere and Open-Meteo forecasts")
+    parser.add_argument("--forecast-dir", type=Path, default=FORECAST_DIR, help="Directory with forecast JSONs")
+    args = parser.parse_args()
+
+    print("=== Blended Forecast Builder ===")
+    gs_forecasts, gs_generated = load_forecast_file(args.forecast_dir / "current_forecast.json")
+    om_forecasts, om_generated = load_forecast_file(args.forecast_dir / "openmeteo_forecast.json")
+    print(f"GeoSphere: {len(gs_forecasts)} resorts, Open-Meteo: {len(om_forecasts)} resorts")
+
+    if not gs_forecasts and not om_forecasts:
+        print("Nothing to blend")
+        return
+
+    output = build_blended_output(gs_forecasts, gs_generated, om_forecasts, om_generated)
+
+    output_path = args.forecast_dir / "blended_forecast.json"
+    write_json_atomic(output_path, output, separators=(',', ':'))
+
+    print(f"Blended {len(output['forecasts'])} resorts")
+    print(f"Exported to {output_path} ({output_path.stat().st_size // 1024} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Pack all per-home travel times into one compact home x resort matrix.
+
+data/travel_times/home_<homeId>.json repeats every stable_id with
+duration_min, duration_sec and distance_km (~120 KB pretty-printed per home).
+This stage writes a single binary matrix instead; a new home adds
+2 x 2 bytes per resort (~6 KB).
+
+Usage:
+    python build_travel_time_matrix.py
+
+Input:
+    data/homes.json, data/resorts.json, data/travel_times/home_<homeId>.json
+
+Output:
+    data/travel_times/matrix.json  Header: home ids, resort id table (row order), scales
+    data/travel_times/matrix.bin   Little-endian uint16, two blocks of [home][resort]:
+                                   1. duration in seconds
+                                   2. distance in 1/DISTANCE_SCALE km
+                                   MISSING (65535) = no value or no route
+                                   (home_<homeId>.json: duration 0, distance null)
+"""
+
+import argparse
+import json
+import sys
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pipeline_utils import write_bytes_atomic, write_json_atomic
+
+# ==============================================================================
+# Configuration
+# ==============================================================================
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+TRAVEL_TIMES_DIR = DATA_DIR / "travel_times"
+
+MISSING = 0xFFFF
+MAX_VALUE = MISSING - 1    # 65534 s = 18.2 h, 6553.4 km
+DISTANCE_SCALE = 10        # 0.1 km resolution
+
+# ==============================================================================
+# Build
+# ==============================================================================
+
+def quantize(value, scale: int = 1, label: str = "value") -> int:
+    """Scale and round to uint16, MISSING for None, clamped to MAX_VALUE (with a warning)."""
+    if value is None:
+        return MISSING
+    scaled = max(0, int(round(value * scale)))
+    if scaled > MAX_VALUE:
+        print(f"  Warning: {label} {value} exceeds the uint16 range, clamped to {MAX_VALUE / scale:g}")
+        return MAX_VALUE
+    return scaled
+
+
+def build_matrix(home_ids: list, resort_ids: list, travel_times_dir: Path) -> tuple[array, array, list]:
+    """
+    Build duration and distance matrices (row-major, home x resort).
+
+    Returns:
+        Tuple of (seconds, distances, included_home_ids); homes without a
+        travel_times file are skipped.
+    """
+    seconds = array('H')
+    distances = array('H')
+    included = []
+
+    for home_id in home_ids:
+        tt_path = travel_times_dir / f"home_{home_id}.json"
+        if not tt_path.exists():
+            print(f"  {home_id}: no travel times, skipped")
+            continue
+        with open(tt_path, 'r', encoding='utf-8') as f:
+            travel_times = json.load(f)
+
+        found = 0
+        no_route = 0
+        for stable_id in resort_ids:
+            tt = travel_times.get(stable_id)
+            if tt is None:
+                seconds.append(MISSING)
+                distances.append(MISSING)
+                continue
+            duration = tt.get('duration_sec')
+            if duration is None and tt.get('duration_min') is not None:
+                duration = tt['duration_min'] * 60
+            if not duration and tt.get('distance_km') is None:
+                # No route found: stored as duration 0, MISSING keeps it out of "0 h away"
+                seconds.append(MISSING)
+                distances.append(MISSING)
+                no_route += 1
+                continue
+            seconds.append(quantize(duration, label=f"{home_id}/{stable_id} duration_sec"))
+            distances.append(quantize(tt.get('distance_km'), DISTANCE_SCALE, label=f"{home_id}/{stable_id} distance_km"))
+            found += 1
+
+        unknown = len(set(travel_times) - set(resort_ids))
+        print(f"  {home_id}: {found}/{len(resort_ids)} resorts"
+              + (f", {no_route} without route" if no_route else "")
+              + (f" ({unknown} unknown ids ignored)" if unknown else ""))
+        included.append(home_id)
+
+    return seconds, distances, included
+
+
+def write_matrix(output_dir: Path, home_ids: list, resort_ids: list, seconds: array, distances: array):
+    """
+    Write matrix.bin + matrix.json, each atomically.
+
+    The binary goes first, the header last: fetch_geosphere_forecast.py reads
+    both while the runner rebuilds the matrix in parallel.
+    """
+    bin_path = output_dir / "matrix.bin"
+    data = array('H', seconds)
+    data.extend(distances)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    write_bytes_atomic(bin_path, data.tobytes())
+
+    header = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "data_file": bin_path.name,
+        "dtype": "uint16-le",
+        "missing": MISSING,
+        "distance_scale": DISTANCE_SCALE,
+        "blocks": ["duration_sec", "distance_km"],
+        "homes": home_ids,
+        "resorts": resort_ids,
+    }
+    write_json_atomic(output_dir / "matrix.json", header, separators=(',', ':'))
+
+    print(f"Exported {len(home_ids)} x {len(resort_ids)} matrix to {bin_path} ({bin_path.stat().st_size // 1024} KB)")
+
+
+# ==============================================================================
+# Loader
+# ==============================================================================
+
+def load_travel_time_matrix(travel_times_dir: Path = TRAVEL_TIMES_DIR) -> dict | None:
+    """
+    Load matrix.json + matrix.bin.
+
+    Returns:
+        Dict with 'homes', 'resorts', 'seconds', 'distances' (flat uint16 arrays,
+        row = home index) and header fields, or None if not built yet.
+    """
+    header_path = travel_times_dir / "matrix.json"
+    if not header_path.exists():
+        return None
+    with open(header_path, 'r', encoding='utf-8') as f:
+        header = json.load(f)
+
+    data = array('H')
+    with open(travel_times_dir / header['data_file'], 'rb') as f:
+        data.frombytes(f.read())
+    if sys.byteorder != 'little':
+        data.byteswap()
+
+    size = len(header['homes']) * len(header['resorts'])
+    if len(data) != 2 * size:
+        # Header and binary from different builds (rebuild in progress)
+        print(f"Warning: {header['data_file']} does not match matrix.json, ignoring the matrix")
+        return None
+    header['seconds'] = data[:size]
+    header['distances'] = data[size:2 * size]
+    return header
+
+
+def get_home_travel_times(matrix: dict, home_id: str) -> dict:
+    """
+    Travel times for one home in the home_<homeId>.json format.
+
+    Returns:
+        { stable_id: {duration_min, duration_sec, distance_km} } (routed resorts only)
+    """
+    if home_id not in matrix['homes']:
+        return {}
+    n = len(matrix['resorts'])
+    row = matrix['homes'].index(home_id) * n
+    missing = matrix['missing']
+    scale = matrix['distance_scale']
+
+    result = {}
+    for i, stable_id in enumerate(matrix['resorts']):
+        sec = matrix['seconds'][row + i]
+        if sec == missing:
+            continue
+        dist = matrix['distances'][row + i]
+        result[stable_id] = {
+            'duration_min': round(sec / 60, 1),
+            'duration_sec': sec,
+            'distance_km': None if dist == missing else dist / scale,
+        }
+    return result
+
+
+# ==============================================================================
+# Main
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the binary home x resort travel time matrix")
+    parser.add_argument("--travel-times-dir", type=Path, default=TRAVEL_TIMES_DIR, help="Directory with home_<id>.json")
+    args = parser.parse_args()
+
+    print("=== Travel Time Matrix Builder ===")
+    with open(DATA_DIR / "homes.json", 'r', encoding='utf-8') as f:
+        home_ids = list(json.load(f))
+    with open(DATA_DIR / "resorts.json", 'r', encoding='utf-8') as f:
+        resort_ids = [r['stable_id'] for r in json.load(f) if r.get('stable_id')]
+    print(f"{len(home_ids)} homes, {len(resort_ids)} resorts")
+
+    seconds, distances, included = build_matrix(home_ids, resort_ids, args.travel_times_dir)
+    if not included:
+        print("No travel times found, nothing exported")
+        return
+    write_matrix(args.travel_times_dir, included, resort_ids, seconds, distances)
+
+
+if __name__ == "__main__":
+    main()
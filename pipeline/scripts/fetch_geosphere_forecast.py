@@ -3,7 +3,18 @@
 Fetch weather forecasts from GeoSphere Austria API and store in database.
 
 Usage:
-    python fetch_geosphere_forecast.py [--dry-run] [--limit N]
+    python fetch_geosphere_forecast.py [--dry-run] [--limit N] [--grid] [--only ID1,ID2,...]
+
+Priority mode (--priority):
+    Ranks resorts by value (travel time from homes, glacier/season, size,
+    staleness of the existing data) and spends the request budget (--budget)
+    on the highest-value resorts first. The rest keep their previous data
+    and are picked up by later runs as they become staler.
+
+Grid mode (--grid):
+    Downloads the model grid for the bounding box of all resorts once per run
+    as NetCDF (1-2 requests instead of dozens of timeseries batches), memory-maps
+    it and samples every resort locally. Requires numpy + scipy (or netCDF4).
 
 GeoSphere API:
     - Dataset: nwp-v1-1h-2500m (Numerische Wettervorhersage)
@@ -25,6 +36,9 @@ from pathlib import Path
 
 import requests
 
+from build_travel_time_matrix import load_travel_time_matrix
+from pipeline_utils import write_json_atomic
+
 # Database connection (optional - can also export to JSON)
 try:
     import psycopg2
@@ -34,6 +48,25 @@ except ImportError:
     HAS_PSYCOPG2 = False
     print("Warning: psycopg2 not installed. Will export to JSON only.")
 
+# Grid mode (--grid) only: numpy + a NetCDF reader
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    from scipy.io import netcdf_file
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+try:
+    import netCDF4
+    HAS_NETCDF4 = True
+except ImportError:
+    HAS_NETCDF4 = False
+
 # ==============================================================================
 # Configuration
 # ==============================================================================
@@ -64,6 +97,34 @@ GEOSPHERE_BBOX = {
     "max_lon": 22.1
 }
 
+# Priority mode: request budget per run (API limit: 240/h) and value weights
+GEOSPHERE_HOURLY_BUDGET = 240
+DEFAULT_HOURLY_BUDGET = 200  # Rolling budget of forecast_daemon.py (headroom below the API limit)
+# Cron runs (3x/day, see .github/workflows, --max-age 5 below the cron spacing)
+# spend a small share each: 30 requests = 600 of the ~1040 AT/DE/CH/SI resorts
+# per run. The top-ranked resorts refresh every run; staleness lifts deferred
+# ones in the following runs. Most of the hourly limit stays free for reruns
+# and the daemon.
+DEFAULT_RUN_BUDGET = 30
+PRIORITY_WEIGHTS = {
+    "proximity": 3.0,   # Close to one of the homes (best travel time)
+    "glacier": 1.0,     # Glacier resorts are open (almost) all year
+    "season": 2.0,      # Currently within seasonStart..seasonEnd
+    "size": 1.5,        # liftsTotal / pistesKm
+    "staleness": 3.0,   # Age of the existing forecast beyond --max-age
+}
+FORECAST_HORIZON_H = 61      # Older entries are dropped instead of kept as stale
+NEVER_FETCHED_STALENESS = 1.5  # Resorts without any forecast rank above the stalest fetched ones
+PROXIMITY_MAX_HOURS = 6.0    # Travel time beyond this gives no proximity value
+SIZE_REF_LIFTS = 40          # Resort size at which the size value saturates
+SIZE_REF_PISTES_KM = 150
+OFF_SEASON_FACTOR = 0.3      # Total value multiplier for closed non-glacier resorts
+
+# Grid mode: bbox padding around resorts (degrees) and number of lon strips
+GRID_PADDING_DEG = 0.1
+GRID_STRIPS = 1          # Split into N requests if the API rejects the full bbox
+GRID_TIMEOUT_S = 300
+
 # Countries with reliable GeoSphere coverage
 COVERED_COUNTRIES = {"AT", "DE", "CH", "SI"}  # FR, IT have limited coverage
 
@@ -124,7 +185,13 @@ def get_resorts_from_json(json_path: Path, limit=None, countries=None):
                 'country': country,
                 'lat': r['lat'],
                 'lon': r['lon'],
-                'max_elevation_m': r.get('maxElevation')
+                'max_elevation_m': r.get('maxElevation'),
+                # Priority scheduling inputs
+                'glacier': bool(r.get('glacier')),
+                'season_start': r.get('seasonStart'),
+                'season_end': r.get('seasonEnd'),
+                'lifts_total': r.get('liftsTotal'),
+                'pistes_km': r.get('pistesKm'),
             })
 
     if limit:
@@ -186,12 +253,16 @@ def is_in_geosphere_coverage(lat: float, lon: float) -> bool:
     )
 
 
-def fetch_forecast_batch(locations: list[tuple[float, float]]) -> dict | None:
+def fetch_forecast_batch(locations: list[tuple[float, float]], on_request=None,
+                         max_retries: int = MAX_RETRIES) -> dict | None:
     """
     Fetch weather forecast from GeoSphere API for multiple points in one request.
 
     Args:
         locations: List of (lat, lon) tuples
+        on_request: Optional callable invoked before every HTTP request
+                    (including retries), for request budget accounting
+        max_retries: Retries on 502/503/429 (lower it to stay within a budget)
 
     Returns:
         Parsed GeoJSON data with multiple features, or None on error.
@@ -207,7 +278,9 @@ def fetch_forecast_batch(locations: list[tuple[float, float]]) -> dict | None:
     for lat, lon in locations:
         params.append(("lat_lon", f"{lat},{lon}"))
 
-    for attempt in range(MAX_RETRIES + 1):
+    for attempt in range(max_retries + 1):
+        if on_request:
+            on_request()
         try:
             response = requests.get(url, params=params, timeout=60)  # Longer timeout for batch
             response.raise_for_status()
@@ -215,14 +288,14 @@ def fetch_forecast_batch(locations: list[tuple[float, float]]) -> dict | None:
         except requests.exceptions.RequestException as e:
             status = getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None
             # Retry on 502, 503, 429 errors
-            if status in (502, 503, 429) and attempt < MAX_RETRIES:
+            if status in (502, 503, 429) and attempt < max_retries:
                 # Rate limit (429) needs longer backoff
                 if status == 429:
                     wait_time = RATE_LIMIT_BACKOFF_S
-                    print(f"\n  [429 Rate Limit] Waiting {wait_time}s before retry {attempt+1}/{MAX_RETRIES}...", end=" ", flush=True)
+                    print(f"\n  [429 Rate Limit] Waiting {wait_time}s before retry {attempt+1}/{max_retries}...", end=" ", flush=True)
                 else:
                     wait_time = (attempt + 1) * 3  # Exponential backoff: 3s, 6s, 9s
-                    print(f"  [{status}] Retry {attempt+1}/{MAX_RETRIES} in {wait_time}s...", end=" ", flush=True)
+                    print(f"  [{status}] Retry {attempt+1}/{max_retries} in {wait_time}s...", end=" ", flush=True)
                 time.sleep(wait_time)
                 continue
             print(f"  Error: {e}")
@@ -313,6 +386,7 @@ def parse_geosphere_batch_response(data: dict, resorts: list) -> dict:
         return {}
 
     results = {}
+    fetched_at = datetime.now(timezone.utc).isoformat()
 
     # Features are returned in same order as requested lat_lon params
     for i, feature in enumerate(features):
@@ -327,6 +401,7 @@ def parse_geosphere_batch_response(data: dict, resorts: list) -> dict:
                 'name': resort['name'],
                 'lat': resort['lat'],
                 'lon': resort['lon'],
+                'fetched_at': fetched_at,
                 'forecasts': forecasts
             }
 
@@ -347,6 +422,401 @@ def parse_geosphere_response(data: dict, max_elevation_m: int = None) -> list:
     return parse_feature_forecasts(features[0], timestamps)
 
 
+# ==============================================================================
+# Priority Scheduling
+# ==============================================================================
+
+def load_best_travel_hours(data_dir: Path) -> dict:
+    """
+    Best (shortest) travel time in hours per stable_id over all homes.
+
+    Uses the travel time matrix if built (build_travel_time_matrix.py),
+    otherwise data/homes.json + data/travel_times/home_<homeId>.json.
+    """
+    matrix = load_travel_time_matrix(data_dir / "travel_times")
+    if matrix:
+        n = len(matrix['resorts'])
+        best = {}
+        for i, stable_id in enumerate(matrix['resorts']):
+            # duration 0 = no route found (see home_muc.json)
+            seconds = [
+                matrix['seconds'][h * n + i] for h in range(len(matrix['homes']))
+                if matrix['seconds'][h * n + i] not in (0, matrix['missing'])
+            ]
+            if seconds:
+                best[stable_id] = min(seconds) / 3600
+        return best
+
+    homes_path = data_dir / "homes.json"
+    if not homes_path.exists():
+        return {}
+    with open(homes_path, 'r', encoding='utf-8') as f:
+        homes = json.load(f)
+
+    best = {}
+    for home_id in homes:
+        tt_path = data_dir / "travel_times" / f"home_{home_id}.json"
+        if not tt_path.exists():
+            continue
+        with open(tt_path, 'r', encoding='utf-8') as f:
+            travel_times = json.load(f)
+        for stable_id, tt in travel_times.items():
+            minutes = tt.get('duration_min')
+            # duration 0 = no route found (see home_muc.json)
+            if not minutes:
+                continue
+            hours = minutes / 60
+            if stable_id not in best or hours < best[stable_id]:
+                best[stable_id] = hours
+    return best
+
+
+def is_in_season(resort: dict, today) -> bool | None:
+    """
+    True/False if season dates are known, None otherwise.
+
+    Only month/day are compared, so the dates from resorts.json (recorded
+    for one particular season) repeat every year. Seasons across the new
+    year (e.g. Dec..Apr) wrap around.
+    """
+    start, end = resort.get('season_start'), resort.get('season_end')
+    if not start or not end:
+        return None
+    try:
+        start, end = datetime.fromisoformat(start).date(), datetime.fromisoformat(end).date()
+    except ValueError:
+        return None
+    start_md, end_md, today_md = (start.month, start.day), (end.month, end.day), (today.month, today.day)
+    if start_md <= end_md:
+        return start_md <= today_md <= end_md
+    return today_md >= start_md or today_md <= end_md
+
+
+def get_forecast_age_hours(entry: dict | None, generated_at: datetime | None, now: datetime) -> float | None:
+    """Age of a resort's existing forecast (per-resort fetched_at, else file timestamp)."""
+    if not entry:
+        return None
+    fetched = generated_at
+    if entry.get('fetched_at'):
+        try:
+            fetched = datetime.fromisoformat(entry['fetched_at'].replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    if fetched is None:
+        return None
+    return (now - fetched).total_seconds() / 3600
+
+
+def score_resort(resort: dict, travel_hours: float | None, age_hours: float | None,
+                 max_age: float, today) -> float:
+    """
+    Refresh value of a resort (higher = refresh first).
+
+    Each signal is normalized to 0..1 and weighted with PRIORITY_WEIGHTS.
+    Staleness runs from 0 at max_age to 1 at FORECAST_HORIZON_H (when the
+    entry would be dropped), so it still ranks resorts that are all due.
+    Resorts without any forecast get NEVER_FETCHED_STALENESS.
+    """
+    w = PRIORITY_WEIGHTS
+    proximity = max(0.0, 1 - travel_hours / PROXIMITY_MAX_HOURS) if travel_hours is not None else 0.0
+    lifts = min(1.0, (resort.get('lifts_total') or 0) / SIZE_REF_LIFTS)
+    pistes = min(1.0, (resort.get('pistes_km') or 0) / SIZE_REF_PISTES_KM)
+    in_season = is_in_season(resort, today)
+    if age_hours is None:
+        staleness = NEVER_FETCHED_STALENESS
+    else:
+        staleness = min(1.0, max(0.0, (age_hours - max_age) / max(1.0, FORECAST_HORIZON_H - max_age)))
+
+    score = (
+        w["proximity"] * proximity
+        + w["glacier"] * (1.0 if resort.get('glacier') else 0.0)
+        + w["season"] * (1.0 if in_season else 0.5 if in_season is None else 0.0)
+        + w["size"] * max(lifts, pistes)
+        + w["staleness"] * staleness
+    )
+    if in_season is False and not resort.get('glacier'):
+        score *= OFF_SEASON_FACTOR
+    return score
+
+
+def prioritize_resorts(resorts: list, existing: dict, generated_at: datetime | None,
+                       max_age: float, data_dir: Path, fetched_before: datetime | None = None,
+                       travel_hours: dict | None = None) -> list:
+    """
+    Sort resorts by refresh value (highest first) and drop fresh ones.
+
+    Resorts whose existing forecast is younger than max_age are skipped, or,
+    if fetched_before is given (e.g. availability of a new model run), those
+    fetched after that time.
+    """
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    if travel_hours is None:
+        travel_hours = load_best_travel_hours(data_dir)
+
+    scored = []
+    for r in resorts:
+        age = get_forecast_age_hours(existing.get(r['stable_id']), generated_at, now)
+        if fetched_before is not None:
+            fresh_age = (now - fetched_before).total_seconds() / 3600
+            if age is not None and age < fresh_age:
+                continue
+        elif age is not None and age < max_age:
+            continue
+        scored.append((score_resort(r, travel_hours.get(r['stable_id']), age, max_age, today), r))
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [r for _, r in scored]
+
+
+# ==============================================================================
+# Grid Mode (NetCDF download + local sampling)
+# ==============================================================================
+
+def get_grid_bbox(resorts: list) -> dict:
+    """Bounding box of all resorts (padded), clipped to GEOSPHERE_BBOX."""
+    return {
+        "min_lat": max(GEOSPHERE_BBOX["min_lat"], min(r['lat'] for r in resorts) - GRID_PADDING_DEG),
+        "max_lat": min(GEOSPHERE_BBOX["max_lat"], max(r['lat'] for r in resorts) + GRID_PADDING_DEG),
+        "min_lon": max(GEOSPHERE_BBOX["min_lon"], min(r['lon'] for r in resorts) - GRID_PADDING_DEG),
+        "max_lon": min(GEOSPHERE_BBOX["max_lon"], max(r['lon'] for r in resorts) + GRID_PADDING_DEG),
+    }
+
+
+def split_bbox(bbox: dict, strips: int) -> list[dict]:
+    """Split a bbox into N longitude strips."""
+    width = (bbox["max_lon"] - bbox["min_lon"]) / strips
+    return [
+        {**bbox, "min_lon": bbox["min_lon"] + i * width, "max_lon": bbox["min_lon"] + (i + 1) * width}
+        for i in range(strips)
+    ]
+
+
+def download_grid(bbox: dict, output_path: Path) -> bool:
+    """
+    Download the forecast grid for a bbox as NetCDF (streamed to disk).
+
+    Returns:
+        True on success
+    """
+    url = f"{GEOSPHERE_BASE_URL}/grid/forecast/{DATASET}"
+    params = {
+        "parameters": ",".join(PARAMETERS),
+        "bbox": f"{bbox['min_lat']:.3f},{bbox['min_lon']:.3f},{bbox['max_lat']:.3f},{bbox['max_lon']:.3f}",
+        "output_format": "netcdf",
+    }
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with requests.get(url, params=params, timeout=GRID_TIMEOUT_S, stream=True) as response:
+                response.raise_for_status()
+                with open(output_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+            return True
+        except requests.exceptions.RequestException as e:
+            status = getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None
+            if status in (502, 503, 429) and attempt < MAX_RETRIES:
+                wait_time = RATE_LIMIT_BACKOFF_S if status == 429 else (attempt + 1) * 3
+                print(f"  [{status}] Retry {attempt+1}/{MAX_RETRIES} in {wait_time}s...", end=" ", flush=True)
+                time.sleep(wait_time)
+                continue
+            print(f"  Error: {e}")
+            return False
+    return False
+
+
+class GridFile:
+    """
+    Read-only view on a downloaded NetCDF grid.
+
+    NetCDF3 (classic) files are memory-mapped via scipy, so only the pages
+    holding sampled cells are read. NetCDF4/HDF5 files (compressed, not
+    mappable) are read through netCDF4 one variable at a time.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            magic = f.read(4)
+        if magic[:3] == b'CDF':
+            if not HAS_SCIPY:
+                raise RuntimeError("scipy required to read NetCDF3 grid")
+            self._nc = netcdf_file(str(path), 'r', mmap=True)
+            self._mapped = True
+        else:
+            if not HAS_NETCDF4:
+                raise RuntimeError("netCDF4 required to read NetCDF4 grid")
+            self._nc = netCDF4.Dataset(str(path), 'r')
+            self._nc.set_auto_mask(False)
+            self._nc.set_auto_scale(False)
+            self._mapped = False
+
+        self.lats = self._axis('lat', 0)
+        self.lons = self._axis('lon', 1)
+        self.timestamps = self._timestamps()
+
+    def close(self):
+        self._nc.close()
+
+    def _axis(self, name: str, axis: int):
+        """1-D coordinate axis (2-D rectilinear lat/lon are reduced to 1-D)."""
+        values = np.asarray(self._nc.variables[name][:], dtype=np.float64)
+        if values.ndim == 2:
+            values = values[:, 0] if axis == 0 else values[0, :]
+        return values
+
+    def _timestamps(self) -> list:
+        """Time axis as ISO strings, same format as the timeseries API."""
+        var = self._nc.variables['time']
+        units = var.units.decode() if isinstance(var.units, bytes) else var.units
+        unit, _, origin = units.partition(' since ')
+        origin = datetime.fromisoformat(origin.strip().replace('Z', '+00:00').replace(' ', 'T'))
+        if origin.tzinfo is None:
+            origin = origin.replace(tzinfo=timezone.utc)
+        seconds = {'seconds': 1, 'minutes': 60, 'hours': 3600, 'days': 86400}[unit.strip()]
+        return [
+            datetime.fromtimestamp(origin.timestamp() + float(v) * seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M+00:00')
+            for v in var[:]
+        ]
+
+    def variable(self, name: str):
+        """(time, lat, lon) array view plus (scale, offset, fill) attributes."""
+        var = self._nc.variables[name]
+        data = var.data if self._mapped else np.asarray(var[:])
+        # Drop singleton dims (e.g. height=1) between time and lat/lon
+        if len(var.shape) > 3:
+            index = tuple(0 if n == 1 else slice(None) for n in var.shape)
+            data = data[index]
+
+        def attr(key, default):
+            value = getattr(var, key, default)
+            return float(np.asarray(value).ravel()[0]) if value is not None else None
+
+        return data, attr('scale_factor', 1.0), attr('add_offset', 0.0), attr('_FillValue', None)
+
+    def sample(self, name: str, lats, lons, method: str = 'bilinear'):
+        """
+        Sample a variable at many points in one vectorized gather.
+
+        Returns:
+            Float array (points, time), NaN where missing or outside the grid.
+        """
+        data, scale, offset, fill = self.variable(name)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+
+        # Regular grid: fractional index from first cell + spacing (handles descending axes)
+        fy = (lats - self.lats[0]) / (self.lats[1] - self.lats[0])
+        fx = (lons - self.lons[0]) / (self.lons[1] - self.lons[0])
+        ny, nx = len(self.lats), len(self.lons)
+        inside = (fy >= 0) & (fy <= ny - 1) & (fx >= 0) & (fx <= nx - 1)
+
+        if method == 'nearest':
+            iy = np.clip(np.rint(fy).astype(int), 0, ny - 1)
+            ix = np.clip(np.rint(fx).astype(int), 0, nx - 1)
+            corners = [(iy, ix, np.ones_like(fy))]
+        else:
+            y0 = np.clip(np.floor(fy).astype(int), 0, ny - 2)
+            x0 = np.clip(np.floor(fx).astype(int), 0, nx - 2)
+            wy = np.clip(fy - y0, 0, 1)
+            wx = np.clip(fx - x0, 0, 1)
+            corners = [
+                (y0, x0, (1 - wy) * (1 - wx)),
+                (y0, x0 + 1, (1 - wy) * wx),
+                (y0 + 1, x0, wy * (1 - wx)),
+                (y0 + 1, x0 + 1, wy * wx),
+            ]
+
+        result = np.zeros((len(lats), data.shape[0]))
+        for iy, ix, weight in corners:
+            values = np.asarray(data[:, iy, ix], dtype=np.float64).T
+            if fill is not None:
+                values[values == fill] = np.nan
+            result += (values * scale + offset) * weight[:, None]
+
+        result[~inside] = np.nan
+        return result
+
+
+def sample_grid_forecasts(grid: GridFile, resorts: list, method: str = 'bilinear') -> dict:
+    """
+    Sample all resorts from a grid and parse them like timeseries features.
+
+    Builds a GeoJSON-like feature per resort and runs it through
+    parse_feature_forecasts(), so accumulation and snow ratio semantics
+    are identical to the timeseries mode.
+
+    Returns:
+        Dict mapping stable_id to forecast data (same format as batch mode)
+    """
+    lats = [r['lat'] for r in resorts]
+    lons = [r['lon'] for r in resorts]
+    sampled = {name: grid.sample(name, lats, lons, method) for name in PARAMETERS}
+
+    results = {}
+    fetched_at = datetime.now(timezone.utc).isoformat()
+    for i, resort in enumerate(resorts):
+        if np.isnan(sampled[PARAMETERS[0]][i]).all():
+            continue
+        feature = {'properties': {'parameters': {
+            name: {'data': [None if np.isnan(v) else float(v) for v in sampled[name][i]]}
+            for name in PARAMETERS
+        }}}
+        forecasts = parse_feature_forecasts(feature, grid.timestamps)
+        if forecasts:
+            results[resort['stable_id']] = {
+                'name': resort['name'],
+                'lat': resort['lat'],
+                'lon': resort['lon'],
+                'fetched_at': fetched_at,
+                'forecasts': forecasts
+            }
+    return results
+
+
+def fetch_grid_forecasts(resorts: list, work_dir: Path, strips: int = GRID_STRIPS, method: str = 'bilinear') -> dict:
+    """
+    Grid mode: download the bbox once (in N strips) and sample all resorts locally.
+
+    Returns:
+        Dict mapping stable_id to forecast data
+    """
+    if not resorts:
+        return {}
+
+    results = {}
+    bboxes = split_bbox(get_grid_bbox(resorts), strips)
+    for idx, bbox in enumerate(bboxes):
+        last = idx == len(bboxes) - 1
+        strip_resorts = [
+            r for r in resorts
+            if bbox["min_lon"] <= r['lon'] < bbox["max_lon"] or (last and r['lon'] == bbox["max_lon"])
+        ]
+        if not strip_resorts:
+            continue
+
+        grid_path = work_dir / f"geosphere_grid_{idx}.nc"
+        print(f"Grid {idx+1}/{len(bboxes)} ({len(strip_resorts)} resorts, "
+              f"lon {bbox['min_lon']:.2f}-{bbox['max_lon']:.2f})...", end=" ", flush=True)
+        if not download_grid(bbox, grid_path):
+            print("Failed")
+            continue
+        print(f"{grid_path.stat().st_size // (1 << 20)} MB", end=" ", flush=True)
+
+        grid = GridFile(grid_path)
+        try:
+            strip_results = sample_grid_forecasts(grid, strip_resorts, method)
+        finally:
+            grid.close()
+        results.update(strip_results)
+        print(f"OK ({len(strip_results)}/{len(strip_resorts)} resorts)")
+
+        if not last:
+            time.sleep(REQUEST_DELAY_S)
+
+    return results
+
+
 # ==============================================================================
 # Export Functions
 # ==============================================================================
@@ -360,8 +830,7 @@ def export_forecasts_to_json(all_forecasts: dict, output_path: Path):
         "forecasts": all_forecasts
     }
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    write_json_atomic(output_path, output, indent=2)
 
     print(f"Exported to {output_path}")
 
@@ -402,8 +871,17 @@ def main():
     parser.add_argument("--resume", action="store_true", help="Resume from previous run (skip already fetched)")
     parser.add_argument("--max-age", type=float, default=12.0, help="Max age in hours before re-fetching (default: 12)")
     parser.add_argument("--save-interval", type=int, default=20, help="Save progress every N resorts")
+    parser.add_argument("--priority", action="store_true", help="Refresh highest-value resorts first within --budget")
+    parser.add_argument("--budget", type=int, default=DEFAULT_RUN_BUDGET, help=f"Max requests per run incl. retries in --priority mode (default: {DEFAULT_RUN_BUDGET})")
+    parser.add_argument("--grid", action="store_true", help="Download the model grid once and sample resorts locally")
+    parser.add_argument("--grid-strips", type=int, default=GRID_STRIPS, help="Split the grid bbox into N requests")
+    parser.add_argument("--grid-interp", choices=["bilinear", "nearest"], default="bilinear", help="Grid sampling method")
+    parser.add_argument("--only", help="Comma-separated stable_ids: refetch these, keep existing data for the rest")
     args = parser.parse_args()
 
+    if args.grid and not (HAS_NUMPY and (HAS_SCIPY or HAS_NETCDF4)):
+        parser.error("--grid requires numpy and scipy or netCDF4")
+
     print(f"=== GeoSphere Forecast Fetcher ===")
     print(f"Time: {datetime.now(timezone.utc).isoformat()}")
     print()
@@ -443,29 +921,63 @@ def main():
     # Load existing forecasts if resuming
     all_forecasts = {}
     data_is_fresh = False
-    if args.resume:
+    if args.only is not None:
+        # Keep existing data for all other resorts in coverage
+        only = {sid.strip() for sid in args.only.split(",") if sid.strip()}
+        existing, _ = load_existing_forecasts(output_path)
+        covered = {r['stable_id'] for r in resorts_in_coverage}
+        all_forecasts = {sid: entry for sid, entry in existing.items() if sid in covered and sid not in only}
+        resorts_to_fetch = [r for r in resorts_in_coverage if r['stable_id'] in only]
+        print(f"Only mode: refetching {len(resorts_to_fetch)} resorts, keeping {len(all_forecasts)} existing")
+    elif args.priority:
+        # Keep existing data (staleness is handled per resort), drop expired entries
         all_forecasts, generated_at = load_existing_forecasts(output_path)
-        if all_forecasts:
-            # Check if data is still fresh
-            if generated_at:
-                age_hours = (datetime.now(timezone.utc) - generated_at).total_seconds() / 3600
-                data_is_fresh = age_hours < args.max_age
-                print(f"Existing data: {len(all_forecasts)} forecasts, {age_hours:.1f}h old (max: {args.max_age}h)")
-                if not data_is_fresh:
-                    print(f"Data too old, will re-fetch all resorts")
-                    all_forecasts = {}  # Clear old data
-            else:
-                print(f"Resuming: loaded {len(all_forecasts)} existing forecasts (no timestamp)")
-                data_is_fresh = True  # Assume fresh if no timestamp
-
-    # Filter out already fetched resorts (only if data is fresh)
-    if all_forecasts and data_is_fresh:
-        resorts_to_fetch = [r for r in resorts_in_coverage if r['stable_id'] not in all_forecasts]
-        already_done = len(resorts_in_coverage) - len(resorts_to_fetch)
-        if already_done > 0:
-            print(f"Skipping {already_done} already fetched resorts")
+        now = datetime.now(timezone.utc)
+        all_forecasts = {
+            sid: entry for sid, entry in all_forecasts.items()
+            if (get_forecast_age_hours(entry, generated_at, now) or 0) < FORECAST_HORIZON_H
+        }
+        resorts_to_fetch = prioritize_resorts(
+            resorts_in_coverage, all_forecasts, generated_at, args.max_age, output_dir.parent
+        )
+        fresh = len(resorts_in_coverage) - len(resorts_to_fetch)
+        print(f"Priority mode: {fresh} resorts fresh (< {args.max_age}h), {len(resorts_to_fetch)} due, budget {args.budget} requests")
     else:
-        resorts_to_fetch = resorts_in_coverage
+        if args.resume:
+            all_forecasts, generated_at = load_existing_forecasts(output_path)
+            if all_forecasts:
+                # Check if data is still fresh
+                if generated_at:
+                    age_hours = (datetime.now(timezone.utc) - generated_at).total_seconds() / 3600
+                    data_is_fresh = age_hours < args.max_age
+                    print(f"Existing data: {len(all_forecasts)} forecasts, {age_hours:.1f}h old (max: {args.max_age}h)")
+                    if not data_is_fresh:
+                        print(f"Data too old, will re-fetch all resorts")
+                        all_forecasts = {}  # Clear old data
+                else:
+                    print(f"Resuming: loaded {len(all_forecasts)} existing forecasts (no timestamp)")
+                    data_is_fresh = True  # Assume fresh if no timestamp
+
+        # Filter out already fetched resorts (only if data is fresh)
+        if all_forecasts and data_is_fresh:
+            resorts_to_fetch = [r for r in resorts_in_coverage if r['stable_id'] not in all_forecasts]
+            already_done = len(resorts_in_coverage) - len(resorts_to_fetch)
+            if already_done > 0:
+                print(f"Skipping {already_done} already fetched resorts")
+        else:
+            resorts_to_fetch = resorts_in_coverage
+
+    if args.grid:
+        print(f"Grid mode: {len(resorts_to_fetch)} resorts, {args.grid_strips} request(s), {args.grid_interp} sampling")
+        grid_results = fetch_grid_forecasts(resorts_to_fetch, output_dir, args.grid_strips, args.grid_interp)
+        all_forecasts.update(grid_results)
+        print()
+        print(f"=== Done ===")
+        print(f"This run: Success: {len(grid_results)}, Errors: {len(resorts_to_fetch) - len(grid_results)}")
+        print(f"Total forecasts: {len(all_forecasts)}")
+        if all_forecasts:
+            export_forecasts_to_json(all_forecasts, output_path)
+        return
 
     # Calculate batches
     num_batches = (len(resorts_to_fetch) + BATCH_SIZE - 1) // BATCH_SIZE
@@ -478,8 +990,20 @@ def main():
     consecutive_errors = 0
     MAX_CONSECUTIVE_ERRORS = 3  # Stop if too many batch errors in a row
 
+    # Priority mode: stop once the budget is spent (retries count as requests)
+    request_budget = args.budget if args.priority else None
+    requests_used = 0
+
+    def count_request():
+        nonlocal requests_used
+        requests_used += 1
+
     for batch_idx in range(num_batches):
         batch_start = batch_idx * BATCH_SIZE
+        if request_budget is not None and requests_used >= request_budget:
+            deferred = len(resorts_to_fetch) - batch_start
+            print(f"Budget of {request_budget} requests spent: deferring {deferred} lowest-priority resorts to later runs")
+            break
         batch_end = min(batch_start + BATCH_SIZE, len(resorts_to_fetch))
         batch_resorts = resorts_to_fetch[batch_start:batch_end]
 
@@ -489,7 +1013,10 @@ def main():
         total_done = len(all_forecasts)
         print(f"Batch {batch_idx+1}/{num_batches} ({len(batch_resorts)} resorts, {total_done} total done)...", end=" ", flush=True)
 
-        data = fetch_forecast_batch(locations)
+        max_retries = MAX_RETRIES
+        if request_budget is not None:
+            max_retries = min(MAX_RETRIES, request_budget - requests_used - 1)
+        data = fetch_forecast_batch(locations, on_request=count_request, max_retries=max_retries)
 
         if data:
             batch_results = parse_geosphere_batch_response(data, batch_resorts)
@@ -530,7 +1057,7 @@ def main():
 
     print()
     print(f"=== Done ===")
-    print(f"This run: Success: {success_count}, Errors: {error_count}")
+    print(f"This run: Success: {success_count}, Errors: {error_count}, Requests: {requests_used}")
     print(f"Total forecasts: {len(all_forecasts)}")
 
     # Export final JSON
@@ -10,7 +10,17 @@ Open-Meteo advantages over GeoSphere:
 - Supports explicit elevation parameter for mountain/valley forecasts
 
 Usage:
-    python fetch_openmeteo_forecast.py [--limit N]
+    python fetch_openmeteo_forecast.py [--limit N] [--bands N] [--models M1,M2,...] [--only ID1,ID2,...]
+
+Band mode (--bands N) requests N elevation bands per resort between min and
+max elevation and stores them as a (resort x band x day x variable) cube in
+data/forecasts/openmeteo_bands.{json,bin}. Every band is a real Open-Meteo
+location, packed BATCH_SIZE locations per request. Requires numpy.
+
+Ensemble mode (--models) requests several weather models in the same batched
+mountain calls and stores per-day median/min/max of snowfall next to the
+mountain 'daily' series (spread = max - min). Valley calls request the
+default model only. Requires numpy.
 
 API Docs: https://open-meteo.com/en/docs
 """
@@ -18,16 +28,28 @@ API Docs: https://open-meteo.com/en/docs
 import argparse
 import json
 import time
+import warnings
 from datetime import datetime, timezone
 from pathlib import Path
 
 import requests
 
+from fix_resort_elevations import apply_corrected_elevations, is_plausible, load_corrected_elevations
+from pipeline_utils import write_bytes_atomic, write_json_atomic
+
+# numpy is only needed for the elevation band cube (--bands)
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 # ==============================================================================
 # Configuration
 # ==============================================================================
 
 OPENMETEO_URL = "https://api.open-meteo.com/v1/forecast"
+FORECAST_DAYS = 16
 
 # Daily parameters for ski resorts
 DAILY_PARAMS = [
@@ -44,6 +66,36 @@ BATCH_PAUSE_S = 1      # Pause between batch requests
 REQUEST_TIMEOUT_S = 60 # Timeout per batch request (longer for multi-location)
 MAX_RETRIES = 3        # Retry failed batches
 
+# Failed batches are not retried inline (blocking sleeps) but queued and
+# retried after the main pass; still failing resorts keep their last good data
+INLINE_RETRIES = 0              # Immediate retries during the main pass
+DEFERRED_RETRY_ROUNDS = 2       # Passes over the retry queue
+DEFERRED_RETRY_DELAY_S = 15     # Pause before each retry round
+
+# Multi-model ensemble (--models mode)
+# The default model ("best_match") is always requested too and feeds 'daily'
+DEFAULT_MODEL = "best_match"
+DEFAULT_ENSEMBLE_MODELS = ["icon_seamless", "ecmwf_ifs025", "gfs_seamless"]
+ENSEMBLE_PARAMS = ["snowfall_sum"]
+ENSEMBLE_MODEL_KEYS = {"sum_7d"}   # Stats with one value per model instead of per day
+
+# Elevation bands (--bands mode)
+# Every band is requested as its own location (BATCH_SIZE locations per
+# request); identical elevations of one resort are only requested once.
+SNOW_CM_PER_MM = 0.7          # Open-Meteo snowfall_sum = 0.7 cm per mm water
+SNOWLINE_MIN_PRECIP_MM = 1.0  # Days with less precipitation have no snow line
+SNOWLINE_MIN_SNOW_RATIO = 0.5 # Band counts as "snowing" if >= 50% falls as snow
+
+# Cube storage: int16 with per-variable scale, -32768 = missing
+BAND_CUBE_SCALES = {
+    "snowfall_sum": 10,
+    "precipitation_sum": 10,
+    "temperature_2m_max": 10,
+    "temperature_2m_min": 10,
+    "weathercode": 1,
+}
+BAND_CUBE_MISSING = -32768
+
 # ==============================================================================
 # Resort Loading
 # ==============================================================================
@@ -66,6 +118,23 @@ def get_resorts_from_json(json_path: Path, limit=None):
                 'max_elevation_m': r.get('maxElevation')
             })
 
+    # DEM-corrected elevations (see fix_resort_elevations.py)
+    corrected = load_corrected_elevations()
+    if corrected:
+        updated = apply_corrected_elevations(result, corrected)
+        print(f"Applied DEM-corrected elevations to {updated}/{len(result)} resorts")
+
+    # Fallback without (matching) corrections, e.g. in CI without DEM tiles:
+    # implausible values are sent as "nan" (API terrain model), inverted ranges swapped
+    sanitized = 0
+    for r in result:
+        low, high = sanitize_elevation_range(r['min_elevation_m'], r['max_elevation_m'])
+        if (low, high) != (r['min_elevation_m'], r['max_elevation_m']):
+            r['min_elevation_m'], r['max_elevation_m'] = low, high
+            sanitized += 1
+    if sanitized:
+        print(f"Sanitized implausible/inverted elevations of {sanitized} resorts")
+
     if limit:
         result = result[:limit]
     return result
@@ -75,7 +144,8 @@ def get_resorts_from_json(json_path: Path, limit=None):
 # Open-Meteo API (Batch Requests)
 # ==============================================================================
 
-def fetch_batch_forecast(resorts: list, elevation_key: str = None, retry_count: int = 0) -> list | None:
+def fetch_batch_forecast(resorts: list, elevation_key: str = None, retry_count: int = 0,
+                         max_retries: int = MAX_RETRIES, models: list = None) -> list | None:
     """
     Fetch 16-day forecasts for multiple locations in a single request.
 
@@ -86,30 +156,53 @@ def fetch_batch_forecast(resorts: list, elevation_key: str = None, retry_count:
         resorts: List of resort dicts with lat, lon, min_elevation_m, max_elevation_m
         elevation_key: 'min_elevation_m' for valley, 'max_elevation_m' for mountain, None for default
         retry_count: Current retry attempt
+        max_retries: Inline retries (with blocking backoff) before giving up
+        models: Weather models to request in the same call (None = API default)
 
     Returns:
         List of API responses (one per location) or None on error
     """
-    if not resorts:
+    locations = [
+        (r['lat'], r['lon'], r.get(elevation_key) if elevation_key else None)
+        for r in resorts
+    ]
+    return fetch_locations_forecast(locations, send_elevation=bool(elevation_key),
+                                    retry_count=retry_count, max_retries=max_retries, models=models)
+
+
+def fetch_locations_forecast(locations: list, send_elevation: bool = True, retry_count: int = 0,
+                             max_retries: int = MAX_RETRIES, models: list = None) -> list | None:
+    """
+    Fetch 16-day forecasts for a list of (lat, lon, elevation) locations in one request.
+
+    Elevation None is sent as "nan" (API uses its terrain model).
+
+    Returns:
+        List of API responses (one per location) or None on error
+    """
+    if not locations:
         return []
 
     # Build comma-separated coordinate strings
-    lats = ",".join(str(r['lat']) for r in resorts)
-    lons = ",".join(str(r['lon']) for r in resorts)
+    lats = ",".join(str(lat) for lat, _, _ in locations)
+    lons = ",".join(str(lon) for _, lon, _ in locations)
 
     params = {
         "latitude": lats,
         "longitude": lons,
         "daily": ",".join(DAILY_PARAMS),
         "timezone": "Europe/Berlin",
-        "forecast_days": 16,
+        "forecast_days": FORECAST_DAYS,
     }
 
+    # Several models in one call: daily keys come back suffixed (snowfall_sum_icon_seamless)
+    if models:
+        params["models"] = ",".join(models)
+
     # Add elevation if specified (for mountain/valley differentiation)
-    if elevation_key:
+    if send_elevation:
         elevations = []
-        for r in resorts:
-            elev = r.get(elevation_key)
+        for _, _, elev in locations:
             if elev is not None:
                 elevations.append(str(int(elev)))
             else:
@@ -128,20 +221,20 @@ def fetch_batch_forecast(resorts: list, elevation_key: str = None, retry_count:
         return data
 
     except requests.exceptions.Timeout as e:
-        if retry_count < MAX_RETRIES:
+        if retry_count < max_retries:
             wait_time = (retry_count + 1) * 5
-            print(f"\n  Timeout, retrying in {wait_time}s (attempt {retry_count + 1}/{MAX_RETRIES})...")
+            print(f"\n  Timeout, retrying in {wait_time}s (attempt {retry_count + 1}/{max_retries})...")
             time.sleep(wait_time)
-            return fetch_batch_forecast(resorts, elevation_key, retry_count + 1)
-        print(f"\n  Error after {MAX_RETRIES} retries: {e}")
+            return fetch_locations_forecast(locations, send_elevation, retry_count + 1, max_retries, models)
+        print(f"\n  Error after {retry_count} retries: {e}")
         return None
 
     except requests.exceptions.RequestException as e:
-        if retry_count < MAX_RETRIES and "429" in str(e):
+        if retry_count < max_retries and "429" in str(e):
             wait_time = (retry_count + 1) * 10
             print(f"\n  Rate limited, waiting {wait_time}s...")
             time.sleep(wait_time)
-            return fetch_batch_forecast(resorts, elevation_key, retry_count + 1)
+            return fetch_locations_forecast(locations, send_elevation, retry_count + 1, max_retries, models)
         print(f"\n  Error: {e}")
         return None
 
@@ -196,6 +289,411 @@ def get_weather_icon(code: int) -> str:
     return "☁️"
 
 
+# ==============================================================================
+# Multi-Model Ensemble
+# ==============================================================================
+
+def split_model_response(data: dict, models: list) -> tuple[dict, dict]:
+    """
+    Split a multi-model response into the default model and the ensemble members.
+
+    Returns:
+        Tuple of (data with unsuffixed 'daily' for DEFAULT_MODEL,
+                  {param: [[values per day] per ensemble model]})
+    """
+    if not data or 'daily' not in data:
+        return data, {}
+    daily = data['daily']
+
+    default_daily = {'time': daily.get('time', [])}
+    for param in DAILY_PARAMS:
+        default_daily[param] = daily.get(f"{param}_{DEFAULT_MODEL}", daily.get(param, []))
+
+    members = {
+        param: [daily.get(f"{param}_{model}") or [] for model in models if model != DEFAULT_MODEL]
+        for param in ENSEMBLE_PARAMS
+    }
+    return {**data, 'daily': default_daily}, members
+
+
+def compute_ensemble_stats(members: list[dict], num_days: int) -> dict:
+    """
+    Per-location, per-day ensemble statistics for a whole batch at once.
+
+    Args:
+        members: One {param: [[values per day] per model]} dict per location
+        num_days: Forecast length
+
+    Returns:
+        {param: {'median', 'min', 'max', 'sum_7d'}} with arrays of
+        shape (location, day), 'sum_7d' of shape (location, model). Params
+        without any member (e.g. no location in the batch has 'daily') are
+        left out, so the result may be empty.
+    """
+    stats = {}
+    for param in ENSEMBLE_PARAMS:
+        num_models = max((len(m.get(param, [])) for m in members), default=0)
+        if num_models == 0:
+            continue
+        values = np.full((len(members), num_models, num_days), np.nan, dtype=np.float32)
+        for loc_idx, m in enumerate(members):
+            for model_idx, series in enumerate(m.get(param, [])):
+                n = min(len(series), num_days)
+                values[loc_idx, model_idx, :n] = [np.nan if v is None else v for v in series[:n]]
+
+        with warnings.catch_warnings():
+            # All-NaN slices (model without data for a day) stay NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            stats[param] = {
+                'median': np.nanmedian(values, axis=1),
+                'min': np.nanmin(values, axis=1),
+                'max': np.nanmax(values, axis=1),
+                'sum_7d': np.where(np.isnan(values[:, :, :7]).all(axis=2), np.nan,
+                                   np.nansum(values[:, :, :7], axis=2)),
+            }
+    return stats
+
+
+def ensemble_entry(stats: dict, loc_idx: int, models: list) -> dict:
+    """Compact JSON entry for one location (stored next to 'daily')."""
+    def to_list(arr):
+        return [None if np.isnan(v) else round(float(v), 1) for v in arr]
+
+    entry = {'models': [m for m in models if m != DEFAULT_MODEL]}
+    for param, param_stats in stats.items():
+        entry[param] = {key: to_list(values[loc_idx]) for key, values in param_stats.items()}
+    return entry
+
+
+# ==============================================================================
+# Retry Queue & Carry-Forward
+# ==============================================================================
+
+def run_deferred_retries(queue: list, retry_item) -> list:
+    """
+    Retry failed work items after the main pass.
+
+    Runs up to DEFERRED_RETRY_ROUNDS rounds with one pause per round (instead
+    of a blocking backoff per batch during the main pass).
+
+    Args:
+        queue: Failed work items
+        retry_item: Callable(item) -> None on success, or the item (or a
+                    smaller leftover item) if it failed again
+
+    Returns:
+        Items that still failed after all rounds
+    """
+    for round_idx in range(DEFERRED_RETRY_ROUNDS):
+        if not queue:
+            break
+        print(f"  Retry round {round_idx + 1}/{DEFERRED_RETRY_ROUNDS}: "
+              f"{len(queue)} failed batches, waiting {DEFERRED_RETRY_DELAY_S}s...")
+        time.sleep(DEFERRED_RETRY_DELAY_S)
+        next_queue = []
+        for item in queue:
+            leftover = retry_item(item)
+            if leftover:
+                next_queue.append(leftover)
+            time.sleep(BATCH_PAUSE_S)
+        queue = next_queue
+    return queue
+
+
+def load_previous_forecasts(output_path: Path) -> tuple[dict, str | None]:
+    """Load the last exported forecasts (for carry-forward)."""
+    if not output_path.exists():
+        return {}, None
+    try:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get('forecasts', {}), data.get('generated_at')
+    except Exception as e:
+        print(f"Warning: Could not load previous forecasts: {e}")
+        return {}, None
+
+
+def trim_to_today(entry: dict, today: str) -> dict | None:
+    """
+    Drop past days from a mountain/valley entry and recompute its snow sums.
+
+    Args:
+        entry: Location entry with 'daily' (and optionally 'ensemble', aligned by day)
+        today: ISO date of the first day to keep
+
+    Returns:
+        Trimmed copy, or None if no day within the forecast horizon is left
+    """
+    daily = entry.get('daily') or []
+    skip = next((i for i, d in enumerate(daily) if d['date'] >= today), len(daily))
+    daily = daily[skip:FORECAST_DAYS + skip]
+    if not daily:
+        return None
+
+    trimmed = dict(entry)
+    trimmed['daily'] = daily
+    trimmed['snow_3d_cm'] = round(sum(f.get('snowfall_cm') or 0 for f in daily[:3]), 1)
+    trimmed['snow_7d_cm'] = round(sum(f.get('snowfall_cm') or 0 for f in daily[:7]), 1)
+    if 'ensemble' in entry:
+        # Per-day series shift like 'daily'; per-model values (sum_7d) have no day axis
+        trimmed['ensemble'] = {
+            param: values if param == 'models' else {
+                key: series if key in ENSEMBLE_MODEL_KEYS else series[skip:FORECAST_DAYS + skip]
+                for key, series in values.items()
+            }
+            for param, values in entry['ensemble'].items()
+        }
+    return trimmed
+
+
+def carry_forward_forecasts(all_forecasts: dict, resorts: list, previous: dict, previous_generated_at: str | None) -> int:
+    """
+    Fill resorts/elevations missing from this run with the last known good data.
+
+    Carried entries get 'stale': True and 'fetched_at' (when the data was
+    actually fetched; kept from earlier carry-forwards). Past days are
+    trimmed; entries whose days have all passed are dropped.
+
+    Returns:
+        Number of carried-forward mountain/valley entries
+    """
+    today = datetime.now(timezone.utc).date().isoformat()
+    carried = 0
+    for resort in resorts:
+        stable_id = resort['stable_id']
+        prev = previous.get(stable_id)
+        if not prev:
+            continue
+        for location_type in ('mountain', 'valley'):
+            if location_type not in prev or location_type in all_forecasts.get(stable_id, {}):
+                continue
+            entry = trim_to_today(prev[location_type], today)
+            if entry is None:
+                continue
+            entry['stale'] = True
+            entry.setdefault('fetched_at', previous_generated_at)
+            all_forecasts.setdefault(stable_id, {
+                'name': resort['name'],
+                'country': resort['country'],
+            })[location_type] = entry
+            carried += 1
+    return carried
+
+
+# ==============================================================================
+# Elevation Bands
+# ==============================================================================
+
+def sanitize_elevation_range(min_elev, max_elev) -> tuple[int | None, int | None]:
+    """
+    Clean up min/max elevation from resorts.json.
+
+    Drops implausible values (e.g. maxElevation: 1, see fix_resort_elevations.is_plausible)
+    and swaps inverted ranges. Returns (low, high); either may be None if unknown.
+    """
+    low = int(min_elev) if is_plausible(min_elev) else None
+    high = int(max_elev) if is_plausible(max_elev) else None
+    if low is not None and high is not None and low > high:
+        low, high = high, low
+    return low, high
+
+
+def get_band_elevations(resort: dict, num_bands: int) -> list:
+    """
+    Evenly spaced band elevations from valley to summit (ascending).
+
+    With only one known elevation all bands collapse onto it; with none,
+    all bands are None (API terrain model).
+    """
+    low, high = sanitize_elevation_range(resort.get('min_elevation_m'), resort.get('max_elevation_m'))
+    if low is None:
+        low = high
+    if high is None:
+        high = low
+    if low is None:
+        return [None] * num_bands
+    if num_bands == 1:
+        return [high]
+    step = (high - low) / (num_bands - 1)
+    return [int(round(low + i * step)) for i in range(num_bands)]
+
+
+def build_band_locations(resorts: list, num_bands: int) -> tuple[list, list, list]:
+    """
+    Flatten (resort, band) pairs into a deduplicated location list.
+
+    Returns:
+        Tuple of (locations, band_elevations, location_index) where
+        locations is a list of (lat, lon, elevation) tuples,
+        band_elevations[r][b] is the elevation of band b and
+        location_index[r][b] points into locations.
+    """
+    locations = []
+    band_elevations = []
+    location_index = []
+
+    for resort in resorts:
+        elevs = get_band_elevations(resort, num_bands)
+        lat, lon = round(resort['lat'], 4), round(resort['lon'], 4)
+        seen = {}
+        indices = []
+        for elev in elevs:
+            if elev not in seen:
+                seen[elev] = len(locations)
+                locations.append((lat, lon, elev))
+            indices.append(seen[elev])
+        band_elevations.append(elevs)
+        location_index.append(indices)
+
+    return locations, band_elevations, location_index
+
+
+def fetch_band_cube(resorts: list, num_bands: int):
+    """
+    Fetch all elevation bands in packed multi-location batches.
+
+    Returns:
+        Tuple of (cube, dates, band_elevations, failed_locations) where cube is a
+        float32 array of shape (resort, band, day, variable), NaN = missing.
+    """
+    locations, _, location_index = build_band_locations(resorts, num_bands)
+    num_batches = (len(locations) + BATCH_SIZE - 1) // BATCH_SIZE
+    print(f"Fetching {num_bands} bands for {len(resorts)} resorts: "
+          f"{len(locations)} unique locations in {num_batches} batches...")
+
+    responses = [None] * len(locations)
+    retry_queue = []
+
+    def fetch_range(batch_range: tuple[int, int], max_retries: int) -> bool:
+        batch_start, batch_end = batch_range
+        batch = fetch_locations_forecast(locations[batch_start:batch_end], max_retries=max_retries)
+        if batch is None:
+            print("Failed (queued for retry)")
+            return False
+        responses[batch_start:batch_start + len(batch)] = batch
+        print(f"OK ({len(batch)}/{batch_end - batch_start})")
+        return True
+
+    for batch_idx in range(num_batches):
+        batch_start = batch_idx * BATCH_SIZE
+        batch_end = min(batch_start + BATCH_SIZE, len(locations))
+        print(f"  [Bands {batch_idx + 1}/{num_batches}] locations {batch_start + 1}-{batch_end}...", end=" ", flush=True)
+
+        if not fetch_range((batch_start, batch_end), INLINE_RETRIES):
+            retry_queue.append((batch_start, batch_end))
+
+        if batch_idx < num_batches - 1:
+            time.sleep(BATCH_PAUSE_S)
+
+    def retry_range(batch_range):
+        print(f"  [Bands retry] locations {batch_range[0] + 1}-{batch_range[1]}...", end=" ", flush=True)
+        return None if fetch_range(batch_range, MAX_RETRIES) else batch_range
+
+    still_failed = run_deferred_retries(retry_queue, retry_range)
+    failed = sum(end - start for start, end in still_failed)
+
+    # Dates from the first successful response
+    dates = []
+    for data in responses:
+        if data and 'daily' in data:
+            dates = data['daily'].get('time', [])
+            break
+
+    # Location x day x variable
+    loc_values = np.full((len(locations), len(dates), len(DAILY_PARAMS)), np.nan, dtype=np.float32)
+    for loc_idx, data in enumerate(responses):
+        if not data or 'daily' not in data:
+            continue
+        daily = data['daily']
+        for var_idx, param in enumerate(DAILY_PARAMS):
+            values = daily.get(param) or []
+            n = min(len(values), len(dates))
+            loc_values[loc_idx, :n, var_idx] = [np.nan if v is None else v for v in values[:n]]
+
+        # Fill in elevations the API picked for "nan" requests
+        if locations[loc_idx][2] is None and data.get('elevation') is not None:
+            locations[loc_idx] = locations[loc_idx][:2] + (int(data['elevation']),)
+
+    # Gather into resort x band (API-chosen elevations are filled in above)
+    cube = loc_values[np.asarray(location_index, dtype=np.intp)]
+    band_elevations = [
+        [locations[loc_idx][2] for loc_idx in indices]
+        for indices in location_index
+    ]
+    return cube, dates, band_elevations, failed
+
+
+def summarize_band_cube(cube, band_elevations: list) -> dict:
+    """
+    Derive snow line and best band per resort from the band cube.
+
+    Snow line (per day): lowest band where at least SNOWLINE_MIN_SNOW_RATIO of
+    the precipitation falls as snow. None if dry or if no band gets snow.
+    Best band: band with the most snowfall over the next 7 days (ties -> higher).
+
+    Returns:
+        Dict with arrays 'snowline_m' (resort x day), 'snow_7d_cm' (resort x band)
+        and 'best_band' (resort).
+    """
+    snow = cube[..., DAILY_PARAMS.index("snowfall_sum")]
+    precip = cube[..., DAILY_PARAMS.index("precipitation_sum")]
+    elevs = np.array([[np.nan if e is None else e for e in row] for row in band_elevations],
+                     dtype=np.float32).reshape(cube.shape[0], cube.shape[1])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        snow_ratio = snow / (precip * SNOW_CM_PER_MM)
+    snowing = (precip >= SNOWLINE_MIN_PRECIP_MM) & (snow_ratio >= SNOWLINE_MIN_SNOW_RATIO)
+
+    # Bands are ascending, so the first snowing band is the snow line
+    first_band = np.argmax(snowing, axis=1)                         # resort x day
+    has_snowline = snowing.any(axis=1)
+    snowline = np.take_along_axis(elevs, first_band, axis=1)
+    snowline = np.where(has_snowline, snowline, np.nan)
+
+    snow_7d = np.nansum(snow[:, :, :7], axis=2)                     # resort x band
+    best_band = cube.shape[1] - 1 - np.argmax(snow_7d[:, ::-1], axis=1)
+
+    return {
+        'snowline_m': snowline,
+        'snow_7d_cm': snow_7d,
+        'best_band': best_band,
+    }
+
+
+def band_cube_to_forecasts(resorts: list, cube, dates: list, band_elevations: list) -> dict:
+    """Build the mountain/valley export (top/bottom band) from the band cube."""
+    all_forecasts = {}
+    for r_idx, resort in enumerate(resorts):
+        entry = {'name': resort['name'], 'country': resort['country']}
+        for location_type, b_idx in (('mountain', -1), ('valley', 0)):
+            values = cube[r_idx, b_idx]
+            if np.isnan(values).all():
+                continue
+            forecasts = []
+            for d_idx, date in enumerate(dates):
+                row = [None if np.isnan(v) else round(float(v), 1) for v in values[d_idx]]
+                code = row[DAILY_PARAMS.index("weathercode")]
+                forecasts.append({
+                    'date': date,
+                    'snowfall_cm': row[DAILY_PARAMS.index("snowfall_sum")],
+                    'precip_mm': row[DAILY_PARAMS.index("precipitation_sum")],
+                    'temp_max': row[DAILY_PARAMS.index("temperature_2m_max")],
+                    'temp_min': row[DAILY_PARAMS.index("temperature_2m_min")],
+                    'weathercode': int(code) if code is not None else None,
+                })
+            snow_3d = sum(f['snowfall_cm'] or 0 for f in forecasts[:3])
+            snow_7d = sum(f['snowfall_cm'] or 0 for f in forecasts[:7])
+            entry[location_type] = {
+                'elevation_m': band_elevations[r_idx][b_idx],
+                'snow_3d_cm': round(snow_3d, 1),
+                'snow_7d_cm': round(snow_7d, 1),
+                'daily': forecasts
+            }
+        if 'mountain' in entry or 'valley' in entry:
+            all_forecasts[resort['stable_id']] = entry
+    return all_forecasts
+
+
 # ==============================================================================
 # Export
 # ==============================================================================
@@ -205,21 +703,71 @@ def export_forecasts_to_json(all_forecasts: dict, output_path: Path):
     output = {
         "generated_at": datetime.now(timezone.utc).isoformat(),
         "source": "Open-Meteo",
-        "forecast_days": 16,
+        "forecast_days": FORECAST_DAYS,
         "forecasts": all_forecasts
     }
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+    write_json_atomic(output_path, output, indent=2)
 
     print(f"Exported to {output_path}")
 
 
+def export_band_cube(resorts: list, cube, dates: list, band_elevations: list, output_dir: Path):
+    """
+    Export the band cube as compact int16 binary plus a JSON header.
+
+    openmeteo_bands.bin: little-endian int16, C-order (resort, band, day, variable),
+                         value = raw / scale, BAND_CUBE_MISSING = missing
+    openmeteo_bands.json: shape, variables, scales, resort order, band
+                          elevations and derived summaries
+    """
+    summary = summarize_band_cube(cube, band_elevations)
+
+    scales = np.array([BAND_CUBE_SCALES[p] for p in DAILY_PARAMS], dtype=np.float32)
+    packed = np.round(cube * scales)
+    packed = np.where(np.isnan(packed), BAND_CUBE_MISSING, packed).astype('<i2')
+    bin_path = output_dir / "openmeteo_bands.bin"
+    write_bytes_atomic(bin_path, packed.tobytes())
+
+    summaries = {}
+    for r_idx, resort in enumerate(resorts):
+        snowline = summary['snowline_m'][r_idx]
+        # Only one known elevation: all bands are the same point, so there is
+        # no snow line or best band to derive
+        has_range = len(set(band_elevations[r_idx])) > 1
+        summaries[resort['stable_id']] = {
+            'bands_m': band_elevations[r_idx],
+            'snow_7d_cm': [round(float(v), 1) for v in summary['snow_7d_cm'][r_idx]],
+            'best_band': int(summary['best_band'][r_idx]) if has_range else None,
+            'snowline_m': [None if np.isnan(v) else int(v) for v in snowline] if has_range else None,
+        }
+
+    header = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "source": "Open-Meteo",
+        "data_file": bin_path.name,
+        "dtype": "int16-le",
+        "shape": list(packed.shape),
+        "dims": ["resort", "band", "day", "variable"],
+        "variables": DAILY_PARAMS,
+        "scales": [BAND_CUBE_SCALES[p] for p in DAILY_PARAMS],
+        "missing": BAND_CUBE_MISSING,
+        "dates": dates,
+        "resorts": [r['stable_id'] for r in resorts],
+        "summaries": summaries,
+    }
+    json_path = output_dir / "openmeteo_bands.json"
+    write_json_atomic(json_path, header, separators=(',', ':'))
+
+    print(f"Exported band cube {tuple(packed.shape)} to {bin_path} ({bin_path.stat().st_size // 1024} KB)")
+
+
 # ==============================================================================
 # Main
 # ==============================================================================
 
-def process_batch(batch_resorts: list, all_forecasts: dict, elevation_key: str, location_type: str) -> tuple[int, int]:
+def process_batch(batch_resorts: list, all_forecasts: dict, elevation_key: str, location_type: str,
+                  max_retries: int = MAX_RETRIES, models: list = None) -> tuple[int, int, list]:
     """
     Process a batch of resorts and update the forecasts dict.
 
@@ -228,20 +776,36 @@ def process_batch(batch_resorts: list, all_forecasts: dict, elevation_key: str,
         all_forecasts: Dict to update with results
         elevation_key: 'min_elevation_m' or 'max_elevation_m'
         location_type: 'valley' or 'mountain'
+        max_retries: Inline retries for the request
+        models: Ensemble models (None = default model only)
 
     Returns:
-        Tuple of (success_count, error_count)
+        Tuple of (success_count, error_count, failed_resorts)
     """
     success = 0
     errors = 0
+    failed = []
 
-    responses = fetch_batch_forecast(batch_resorts, elevation_key)
+    request_models = [DEFAULT_MODEL] + [m for m in models if m != DEFAULT_MODEL] if models else None
+    responses = fetch_batch_forecast(batch_resorts, elevation_key, max_retries=max_retries, models=request_models)
 
     if responses is None:
         # Entire batch failed
-        return 0, len(batch_resorts)
+        return 0, len(batch_resorts), list(batch_resorts)
+
+    ensemble_stats = None
+    if models:
+        split = [split_model_response(data, request_models) for data in responses]
+        responses = [data for data, _ in split]
+        num_days = max((len(d['daily'].get('time', [])) for d in responses if d and 'daily' in d), default=0)
+        ensemble_stats = compute_ensemble_stats([members for _, members in split], num_days)
+
+    # Locations missing from a truncated response count as failed
+    if len(responses) < len(batch_resorts):
+        failed.extend(batch_resorts[len(responses):])
+        errors += len(batch_resorts) - len(responses)
 
-    for resort, data in zip(batch_resorts, responses):
+    for loc_idx, (resort, data) in enumerate(zip(batch_resorts, responses)):
         stable_id = resort['stable_id']
         forecasts = parse_openmeteo_response(data)
 
@@ -263,14 +827,20 @@ def process_batch(batch_resorts: list, all_forecasts: dict, elevation_key: str,
                 'snow_7d_cm': round(snow_7d, 1),
                 'daily': forecasts
             }
+            if ensemble_stats:
+                all_forecasts[stable_id][location_type]['ensemble'] = ensemble_entry(
+                    ensemble_stats, loc_idx, request_models
+                )
             success += 1
         else:
             errors += 1
+            failed.append(resort)
 
-    return success, errors
+    return success, errors, failed
 
 
-def fetch_all_forecasts(resorts: list, elevation_key: str, location_type: str, all_forecasts: dict) -> tuple[int, int]:
+def fetch_all_forecasts(resorts: list, elevation_key: str, location_type: str, all_forecasts: dict,
+                        retry_queue: list, models: list = None) -> tuple[int, int]:
     """
     Fetch forecasts for all resorts at a specific elevation (mountain or valley).
 
@@ -279,6 +849,8 @@ def fetch_all_forecasts(resorts: list, elevation_key: str, location_type: str, a
         elevation_key: 'min_elevation_m' or 'max_elevation_m'
         location_type: 'valley' or 'mountain'
         all_forecasts: Dict to update with results
+        retry_queue: Failed (resorts, elevation_key, location_type) items are appended here
+        models: Ensemble models (None = default model only)
 
     Returns:
         Tuple of (total_success, total_errors)
@@ -297,11 +869,17 @@ def fetch_all_forecasts(resorts: list, elevation_key: str, location_type: str, a
         last_name = batch_resorts[-1]['name'].encode('ascii', 'replace').decode('ascii')
         print(f"  [{location_type.capitalize()} {batch_idx + 1}/{num_batches}] {first_name} ... {last_name}...", end=" ", flush=True)
 
-        success, errors = process_batch(batch_resorts, all_forecasts, elevation_key, location_type)
+        success, errors, failed = process_batch(batch_resorts, all_forecasts, elevation_key, location_type,
+                                                max_retries=INLINE_RETRIES, models=models)
         total_success += success
         total_errors += errors
+        if failed:
+            retry_queue.append((failed, elevation_key, location_type))
 
-        print(f"OK ({success}/{len(batch_resorts)})")
+        if success == 0 and failed:
+            print(f"Failed, {len(failed)} queued for retry")
+        else:
+            print(f"OK ({success}/{len(batch_resorts)})" + (f", {len(failed)} queued for retry" if failed else ""))
 
         # Pause between batches (except after the last one)
         if batch_idx < num_batches - 1:
@@ -310,12 +888,97 @@ def fetch_all_forecasts(resorts: list, elevation_key: str, location_type: str, a
     return total_success, total_errors
 
 
+def fetch_mountain_valley(resorts: list, models: list = None) -> dict:
+    """
+    Fetch mountain + valley forecasts for all resorts, with deferred retries.
+
+    Args:
+        resorts: List of resort dicts
+        models: Ensemble models (None = default model only)
+
+    Returns:
+        Dict mapping stable_id to mountain/valley forecasts (failed resorts missing)
+    """
+    all_forecasts = {}
+    retry_queue = []
+    start_time = time.time()
+
+    # First pass: Mountain (max_elevation)
+    print("--- Fetching MOUNTAIN forecasts (max elevation) ---")
+    mountain_success, mountain_errors = fetch_all_forecasts(
+        resorts, 'max_elevation_m', 'mountain', all_forecasts, retry_queue, models
+    )
+    print(f"Mountain: {mountain_success} success, {mountain_errors} errors")
+    print()
+
+    # Second pass: Valley (min_elevation), ensemble stats are kept for the mountain only
+    print("--- Fetching VALLEY forecasts (min elevation) ---")
+    valley_success, valley_errors = fetch_all_forecasts(
+        resorts, 'min_elevation_m', 'valley', all_forecasts, retry_queue
+    )
+    print(f"Valley: {valley_success} success, {valley_errors} errors")
+    print()
+
+    # Deferred retries for failed batches
+    retried = 0
+    if retry_queue:
+        print("--- Retrying failed batches ---")
+
+        def retry_batch(item):
+            nonlocal retried
+            batch_resorts, elevation_key, location_type = item
+            print(f"  [{location_type.capitalize()} retry] {len(batch_resorts)} resorts...", end=" ", flush=True)
+            success, _, failed = process_batch(batch_resorts, all_forecasts, elevation_key, location_type,
+                                               models=models if location_type == 'mountain' else None)
+            retried += success
+            print(f"OK ({success}/{len(batch_resorts)})")
+            return (failed, elevation_key, location_type) if failed else None
+
+        still_failed = run_deferred_retries(retry_queue, retry_batch)
+        print(f"Recovered {retried} forecasts, {sum(len(item[0]) for item in still_failed)} still failing")
+        print()
+
+    elapsed = time.time() - start_time
+    print(f"=== Done in {elapsed:.1f}s ===")
+    print(f"Total: {mountain_success + valley_success + retried} forecasts, "
+          f"{mountain_errors + valley_errors - retried} errors")
+
+    return all_forecasts
+
+
 def main():
     parser = argparse.ArgumentParser(description="Fetch Open-Meteo weather forecasts")
     parser.add_argument("--limit", type=int, help="Limit number of resorts to fetch")
+    parser.add_argument("--bands", type=int, help="Fetch N elevation bands per resort (N >= 2, requires numpy)")
+    parser.add_argument("--models", nargs="?", const=",".join(DEFAULT_ENSEMBLE_MODELS),
+                        help=f"Ensemble mode: comma-separated models (default: {','.join(DEFAULT_ENSEMBLE_MODELS)}, requires numpy)")
+    parser.add_argument("--only", help="Comma-separated stable_ids: refetch these, keep previous data for the rest")
     args = parser.parse_args()
 
+    if args.models is not None:
+        args.models = [m.strip() for m in args.models.split(",") if m.strip()]
+        if not [m for m in args.models if m != DEFAULT_MODEL]:
+            parser.error(f"--models needs at least one model besides {DEFAULT_MODEL}")
+        if args.bands is not None:
+            parser.error("--models cannot be combined with --bands")
+        if not HAS_NUMPY:
+            parser.error("--models requires numpy (pip install numpy)")
+
+    if args.only is not None:
+        args.only = {sid.strip() for sid in args.only.split(",") if sid.strip()}
+
+    if args.bands is not None:
+        if args.only is not None:
+            parser.error("--only cannot be combined with --bands")
+        if args.bands < 2:
+            parser.error("--bands must be at least 2")
+        if not HAS_NUMPY:
+            parser.error("--bands requires numpy (pip install numpy)")
+        return main_bands(args)
+
     print("=== Open-Meteo Forecast Fetcher (Mountain/Valley Mode) ===")
+    if args.models:
+        print(f"Ensemble models: {', '.join(args.models)}")
     print(f"Time: {datetime.now(timezone.utc).isoformat()}")
     print()
 
@@ -333,39 +996,76 @@ def main():
     print(f"Resorts with elevation data: {with_elevation}/{len(resorts)}")
     print()
 
+    output_dir = Path(__file__).parent.parent.parent / "data" / "forecasts"
+    output_dir.mkdir(exist_ok=True)
+    output_path = output_dir / "openmeteo_forecast.json"
+    previous, previous_generated_at = load_previous_forecasts(output_path)
+
+    resorts_to_fetch = resorts
+    if args.only is not None:
+        resorts_to_fetch = [r for r in resorts if r['stable_id'] in args.only]
+        print(f"Only mode: refetching {len(resorts_to_fetch)} resorts, keeping previous data for the rest")
+
     # Calculate total batches (2x for mountain + valley)
-    num_batches = (len(resorts) + BATCH_SIZE - 1) // BATCH_SIZE
+    num_batches = (len(resorts_to_fetch) + BATCH_SIZE - 1) // BATCH_SIZE
     print(f"Fetching 16-day forecasts: {num_batches} batches x 2 (mountain + valley)...")
     print()
 
-    all_forecasts = {}
-    start_time = time.time()
+    all_forecasts = fetch_mountain_valley(resorts_to_fetch, args.models)
 
-    # First pass: Mountain (max_elevation)
-    print("--- Fetching MOUNTAIN forecasts (max elevation) ---")
-    mountain_success, mountain_errors = fetch_all_forecasts(
-        resorts, 'max_elevation_m', 'mountain', all_forecasts
-    )
-    print(f"Mountain: {mountain_success} success, {mountain_errors} errors")
-    print()
+    if args.only is not None:
+        # Unchanged resorts keep their previous entries as they are (removed resorts are dropped)
+        for r in resorts:
+            if r['stable_id'] not in args.only and r['stable_id'] in previous:
+                all_forecasts[r['stable_id']] = previous[r['stable_id']]
 
-    # Second pass: Valley (min_elevation)
-    print("--- Fetching VALLEY forecasts (min elevation) ---")
-    valley_success, valley_errors = fetch_all_forecasts(
-        resorts, 'min_elevation_m', 'valley', all_forecasts
-    )
-    print(f"Valley: {valley_success} success, {valley_errors} errors")
+    # Keep last known good data for resorts that still failed
+    carried = carry_forward_forecasts(all_forecasts, resorts, previous, previous_generated_at)
+    if carried:
+        print(f"Carried forward {carried} stale forecasts from previous run")
+
+    # Export
+    if all_forecasts:
+        export_forecasts_to_json(all_forecasts, output_path)
+
+
+def main_bands(args):
+    """Band mode: fetch the elevation band cube and derive the mountain/valley export from it."""
+    print(f"=== Open-Meteo Forecast Fetcher (Band Mode, {args.bands} bands) ===")
+    print(f"Time: {datetime.now(timezone.utc).isoformat()}")
     print()
 
+    json_path = Path(__file__).parent.parent.parent / "data" / "resorts.json"
+    if not json_path.exists():
+        print(f"Error: {json_path} not found")
+        return
+
+    resorts = get_resorts_from_json(json_path, args.limit)
+    print(f"Loaded {len(resorts)} resorts from {json_path}")
+
+    start_time = time.time()
+    cube, dates, band_elevations, failed = fetch_band_cube(resorts, args.bands)
     elapsed = time.time() - start_time
+    print()
     print(f"=== Done in {elapsed:.1f}s ===")
-    print(f"Total: {mountain_success + valley_success} forecasts, {mountain_errors + valley_errors} errors")
+    print(f"Failed locations: {failed}")
 
-    # Export
+    if not dates:
+        print("No data received, nothing exported")
+        return
+
+    output_dir = Path(__file__).parent.parent.parent / "data" / "forecasts"
+    output_dir.mkdir(exist_ok=True)
+    export_band_cube(resorts, cube, dates, band_elevations, output_dir)
+
+    all_forecasts = band_cube_to_forecasts(resorts, cube, dates, band_elevations)
+    output_path = output_dir / "openmeteo_forecast.json"
+    previous, previous_generated_at = load_previous_forecasts(output_path)
+    carried = carry_forward_forecasts(all_forecasts, resorts, previous, previous_generated_at)
+    if carried:
+        print(f"Carried forward {carried} stale forecasts from previous run")
     if all_forecasts:
-        output_dir = Path(__file__).parent.parent.parent / "data" / "forecasts"
-        output_dir.mkdir(exist_ok=True)
-        export_forecasts_to_json(all_forecasts, output_dir / "openmeteo_forecast.json")
+        export_forecasts_to_json(all_forecasts, output_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Fix and fill resort elevations from a local DEM before fetching forecasts.
+
+resorts.json often has missing (-> "nan" sent to Open-Meteo) or wrong
+elevations (e.g. maxElevation: 1, min > max), which silently gives
+valley-level forecasts for summits. This stage samples a digital elevation
+model at every resort center and primary access point (lift base station),
+flags implausible values and writes corrected values per resort. DEM samples
+are cached keyed by coordinates, so reruns only sample new or moved points.
+A corrected value is only applied while the resort coordinates and the
+min/max elevation in resorts.json are still the ones it was computed from.
+The fetchers pick up the result via load_corrected_elevations().
+
+DEM format:
+    SRTM .hgt tiles (1" = 3601x3601 or 3" = 1201x1201, big-endian int16),
+    named like N47E011.hgt, in data/dem/ (override with --dem-dir).
+    Tiles are memory-mapped, only the touched pages are read.
+    Download e.g. from https://viewfinderpanoramas.org/dem3.html
+
+Usage:
+    python fix_resort_elevations.py [--dem-dir DIR] [--dry-run] [--resample]
+
+Output:
+    data/resort_elevations.json
+        "elevations":  { "<stable_id>": {lat, lon, source_min_elevation_m, source_max_elevation_m,
+                                         min_elevation_m, max_elevation_m, flags}, ... }
+        "dem_samples": { "<lat>,<lon>": {"elev": m, "summit": m}, ... }
+"""
+
+import argparse
+import json
+import math
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pipeline_utils import write_json_atomic
+
+# numpy is only needed to sample the DEM (not to read the cache)
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# ==============================================================================
+# Configuration
+# ==============================================================================
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+DEFAULT_DEM_DIR = DATA_DIR / "dem"
+CACHE_PATH = DATA_DIR / "resort_elevations.json"
+
+HGT_VOID = -32768              # SRTM no-data value
+COORD_PRECISION = 5            # Decimals for cache keys (~1 m)
+
+MIN_PLAUSIBLE_ELEVATION_M = 150
+MAX_PLAUSIBLE_ELEVATION_M = 4800
+VALLEY_TOLERANCE_M = 400       # Max allowed |minElevation - DEM base|
+SUMMIT_RADIUS_M = 2500         # Search radius around center for the summit estimate
+SUMMIT_METHOD = "cross_tile"   # Cached summits from other methods are resampled
+SUMMIT_CHUNK = 64              # Points per vectorized summit window batch
+MIN_VERTICAL_M = 50            # Below this, min/max are treated as the same point
+PLACEHOLDER_SHARE_COUNT = 3    # Coordinates shared by this many resorts are placeholders
+
+# ==============================================================================
+# Cache (used by the fetchers)
+# ==============================================================================
+
+def coord_key(lat: float, lon: float) -> str:
+    """Cache key for a coordinate pair."""
+    return f"{lat:.{COORD_PRECISION}f},{lon:.{COORD_PRECISION}f}"
+
+
+def load_elevation_cache(cache_path: Path = CACHE_PATH) -> dict:
+    """Load the full cache file, or {} if not available."""
+    if not cache_path.exists():
+        return {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not load elevation cache: {e}")
+        return {}
+
+
+def load_corrected_elevations(cache_path: Path = CACHE_PATH) -> dict:
+    """Load corrected elevations keyed by stable_id, or {} if not available."""
+    return load_elevation_cache(cache_path).get('elevations', {})
+
+
+def apply_corrected_elevations(resorts: list, corrected: dict) -> int:
+    """
+    Replace min/max elevation of resort dicts (fetcher format) with cached values.
+
+    Entries only match if the resort coordinates and the original min/max
+    elevation are unchanged (a later fix in resorts.json wins).
+
+    Returns:
+        Number of resorts updated
+    """
+    updated = 0
+    for r in resorts:
+        entry = corrected.get(r['stable_id'])
+        if not entry or coord_key(entry['lat'], entry['lon']) != coord_key(r['lat'], r['lon']):
+            continue
+        if (entry.get('source_min_elevation_m', 'missing') != r.get('min_elevation_m')
+                or entry.get('source_max_elevation_m', 'missing') != r.get('max_elevation_m')):
+            continue
+        r['min_elevation_m'] = entry.get('min_elevation_m')
+        r['max_elevation_m'] = entry.get('max_elevation_m')
+        updated += 1
+    return updated
+
+
+# ==============================================================================
+# DEM Sampling
+# ==============================================================================
+
+def hgt_tile_name(lat_floor: int, lon_floor: int) -> str:
+    """SRTM tile name for the tile whose south-west corner is (lat_floor, lon_floor)."""
+    ns = 'N' if lat_floor >= 0 else 'S'
+    ew = 'E' if lon_floor >= 0 else 'W'
+    return f"{ns}{abs(lat_floor):02d}{ew}{abs(lon_floor):03d}.hgt"
+
+
+class HgtDem:
+    """Directory of SRTM .hgt tiles, memory-mapped on first access."""
+
+    def __init__(self, dem_dir: Path):
+        self.dem_dir = dem_dir
+        self._tiles = {}
+
+    def tile(self, lat_floor: int, lon_floor: int):
+        """Return the memory-mapped tile array, or None if the tile is missing."""
+        key = (lat_floor, lon_floor)
+        if key not in self._tiles:
+            path = self.dem_dir / hgt_tile_name(lat_floor, lon_floor)
+            tile = None
+            if path.exists():
+                size = int(math.isqrt(path.stat().st_size // 2))
+                tile = np.memmap(path, dtype='>i2', mode='r', shape=(size, size))
+            self._tiles[key] = tile
+        return self._tiles[key]
+
+    def sample(self, lats, lons):
+        """
+        Bilinear elevation sampling for arrays of coordinates.
+
+        Points are grouped per tile; each tile is sampled in one vectorized step.
+        Returns float array, NaN where the tile is missing or void.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(lats.shape, np.nan)
+
+        lat_floor = np.floor(lats).astype(int)
+        lon_floor = np.floor(lons).astype(int)
+        for la, lo in set(zip(lat_floor.tolist(), lon_floor.tolist())):
+            tile = self.tile(la, lo)
+            if tile is None:
+                continue
+            mask = (lat_floor == la) & (lon_floor == lo)
+            n = tile.shape[0] - 1
+
+            # Row 0 is the northern edge of the tile
+            rows = (la + 1 - lats[mask]) * n
+            cols = (lons[mask] - lo) * n
+            r0 = np.clip(np.floor(rows).astype(int), 0, n - 1)
+            c0 = np.clip(np.floor(cols).astype(int), 0, n - 1)
+            fr = rows - r0
+            fc = cols - c0
+
+            corners = np.stack([
+                tile[r0, c0], tile[r0, c0 + 1],
+                tile[r0 + 1, c0], tile[r0 + 1, c0 + 1],
+            ]).astype(np.float64)
+            corners[corners == HGT_VOID] = np.nan
+
+            top = corners[0] * (1 - fc) + corners[1] * fc
+            bottom = corners[2] * (1 - fc) + corners[3] * fc
+            result[mask] = top * (1 - fr) + bottom * fr
+
+        return result
+
+    def nearest(self, lats, lons):
+        """Nearest-cell elevation for arrays of coordinates (any tiles), NaN if missing or void."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(lats.shape, np.nan)
+
+        lat_floor = np.floor(lats).astype(int)
+        lon_floor = np.floor(lons).astype(int)
+        tile_ids = lat_floor * 1000 + lon_floor
+        for tile_id in np.unique(tile_ids).tolist():
+            mask = tile_ids == tile_id
+            la, lo = int(lat_floor[mask][0]), int(lon_floor[mask][0])
+            tile = self.tile(la, lo)
+            if tile is None:
+                continue
+            n = tile.shape[0] - 1
+            rows = np.clip(np.rint((la + 1 - lats[mask]) * n).astype(int), 0, n)
+            cols = np.clip(np.rint((lons[mask] - lo) * n).astype(int), 0, n)
+            values = np.asarray(tile[rows, cols], dtype=np.float64)
+            values[values == HGT_VOID] = np.nan
+            result[mask] = values
+        return result
+
+    def cells_per_degree(self, lats, lons) -> int | None:
+        """Finest resolution among the tiles holding the given points (None if none exist)."""
+        sizes = [
+            tile.shape[0] - 1
+            for la, lo in set(zip(np.floor(lats).astype(int).tolist(), np.floor(lons).astype(int).tolist()))
+            if (tile := self.tile(la, lo)) is not None
+        ]
+        return max(sizes) if sizes else None
+
+    def window_max(self, lats, lons, radius_m: float):
+        """
+        Highest DEM value within radius_m (square window) around each point.
+
+        The window is sampled as a grid of coordinates at (at most) one cell
+        spacing, so it spans neighbouring tiles near tile borders. Points are
+        processed in chunks of SUMMIT_CHUNK, each in one vectorized lookup.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(len(lats), np.nan)
+        res = self.cells_per_degree(lats, lons)
+        if res is None:
+            return result
+
+        dlat = radius_m / 111_320
+        dr = max(1, int(dlat * res))
+        for start in range(0, len(lats), SUMMIT_CHUNK):
+            chunk_lats = lats[start:start + SUMMIT_CHUNK]
+            chunk_lons = lons[start:start + SUMMIT_CHUNK]
+            dlon = radius_m / (111_320 * np.cos(np.radians(chunk_lats)))
+            dc = max(1, int(dlon.max() * res))
+
+            # (point, row offset, col offset) grid; normalized offsets keep the spacing <= 1 cell
+            grid_lats = chunk_lats[:, None, None] + (np.arange(-dr, dr + 1) / dr * dlat)[None, :, None]
+            grid_lons = chunk_lons[:, None, None] + (np.arange(-dc, dc + 1) / dc)[None, None, :] * dlon[:, None, None]
+            grid_lats, grid_lons = np.broadcast_arrays(grid_lats, grid_lons)
+
+            values = self.nearest(grid_lats.ravel(), grid_lons.ravel()).reshape(len(chunk_lats), -1)
+            valid = ~np.isnan(values).all(axis=1)
+            result[start:start + SUMMIT_CHUNK][valid] = np.nanmax(values[valid], axis=1)
+        return result
+
+
+# ==============================================================================
+# Correction
+# ==============================================================================
+
+def is_plausible(elevation) -> bool:
+    """Elevation is set and within the range of European ski resorts."""
+    return elevation is not None and MIN_PLAUSIBLE_ELEVATION_M <= elevation <= MAX_PLAUSIBLE_ELEVATION_M
+
+
+def correct_elevation(min_elev, max_elev, dem_base, dem_summit) -> dict:
+    """
+    Correct one resort's elevation range against DEM estimates.
+
+    Args:
+        min_elev, max_elev: Values from resorts.json (may be None/garbage)
+        dem_base: DEM elevation at the access point (or center), NaN if unknown
+        dem_summit: Highest DEM elevation near the center, NaN if unknown
+
+    Returns:
+        Dict with min_elevation_m, max_elevation_m and a list of flags
+    """
+    flags = []
+    low = min_elev if is_plausible(min_elev) else None
+    high = max_elev if is_plausible(max_elev) else None
+    if min_elev is not None and low is None:
+        flags.append('min_implausible')
+    if max_elev is not None and high is None:
+        flags.append('max_implausible')
+
+    if low is not None and high is not None and low > high:
+        low, high = high, low
+        flags.append('swapped')
+
+    has_base = not math.isnan(dem_base)
+    has_summit = not math.isnan(dem_summit)
+
+    if has_base and (low is None or abs(low - dem_base) > VALLEY_TOLERANCE_M):
+        flags.append('min_from_dem' if low is None else 'min_corrected')
+        low = int(round(dem_base))
+
+    if has_summit and (high is None or high > dem_summit + VALLEY_TOLERANCE_M):
+        flags.append('max_from_dem' if high is None else 'max_corrected')
+        high = int(round(dem_summit))
+
+    if low is not None and high is not None and high - low < MIN_VERTICAL_M:
+        if has_summit and dem_summit - low >= MIN_VERTICAL_M:
+            high = int(round(dem_summit))
+            flags.append('max_from_dem')
+
+    if low is not None and high is not None and low > high:
+        low, high = high, low
+        if 'swapped' not in flags:
+            flags.append('swapped')
+
+    return {
+        'min_elevation_m': low,
+        'max_elevation_m': high,
+        'flags': flags,
+    }
+
+
+def sample_missing(dem: HgtDem, dem_samples: dict, centers: list, points: list) -> int:
+    """
+    Sample all coordinates not yet in dem_samples (updated in place).
+
+    Args:
+        centers: (lat, lon) resort centers, get 'elev' and 'summit'
+        points: (lat, lon) access points, get 'elev' only
+
+    Returns:
+        Number of newly sampled coordinates
+    """
+    todo = {}
+    for lat, lon in centers:
+        key = coord_key(lat, lon)
+        if 'summit' not in dem_samples.get(key, {}):
+            todo[key] = (lat, lon, True)
+    for lat, lon in points:
+        key = coord_key(lat, lon)
+        if key not in dem_samples and key not in todo:
+            todo[key] = (lat, lon, False)
+    if not todo:
+        return 0
+
+    keys = list(todo)
+    lats = np.array([todo[k][0] for k in keys])
+    lons = np.array([todo[k][1] for k in keys])
+    elev = dem.sample(lats, lons)
+
+    summit_idx = [i for i, k in enumerate(keys) if todo[k][2]]
+    summit = np.full(len(keys), np.nan)
+    if summit_idx:
+        summit[summit_idx] = dem.window_max(lats[summit_idx], lons[summit_idx], SUMMIT_RADIUS_M)
+
+    for i, key in enumerate(keys):
+        entry = {'elev': None if np.isnan(elev[i]) else int(round(elev[i]))}
+        if todo[key][2]:
+            entry['summit'] = None if np.isnan(summit[i]) else int(summit[i])
+        dem_samples[key] = entry
+    return len(keys)
+
+
+def compute_corrections(resorts: list, dem_samples: dict) -> dict:
+    """Correct all resorts from (already sampled) DEM values, keyed by stable_id."""
+    def sample(lat, lon, field):
+        value = dem_samples.get(coord_key(lat, lon), {}).get(field)
+        return float('nan') if value is None else float(value)
+
+    # Several resorts share placeholder coordinates (e.g. 12x 47.342262,11.847215),
+    # the DEM says nothing about those
+    shared = Counter(coord_key(r['lat'], r['lon']) for r in resorts)
+
+    corrections = {}
+    for r in resorts:
+        source = {
+            'lat': r['lat'],
+            'lon': r['lon'],
+            'source_min_elevation_m': r.get('minElevation'),
+            'source_max_elevation_m': r.get('maxElevation'),
+        }
+        if shared[coord_key(r['lat'], r['lon'])] >= PLACEHOLDER_SHARE_COUNT:
+            nan = float('nan')
+            entry = correct_elevation(r.get('minElevation'), r.get('maxElevation'), nan, nan)
+            entry['flags'].append('placeholder_coordinates')
+            corrections[r['stable_id']] = {**source, **entry}
+            continue
+
+        center = sample(r['lat'], r['lon'], 'elev')
+
+        # Base: primary access point (lift base station) if known, else resort center
+        base = center
+        ap = r.get('primaryAccessPoint')
+        if ap and ap.get('lat') and ap.get('lon'):
+            base = np.fmin(sample(ap['lat'], ap['lon'], 'elev'), center)
+        summit = np.fmax(sample(r['lat'], r['lon'], 'summit'), center)
+
+        entry = correct_elevation(r.get('minElevation'), r.get('maxElevation'), float(base), float(summit))
+        corrections[r['stable_id']] = {**source, **entry}
+    return corrections
+
+
+# ==============================================================================
+# Main
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Fix resort elevations from a local DEM")
+    parser.add_argument("--dem-dir", type=Path, default=DEFAULT_DEM_DIR, help="Directory with SRTM .hgt tiles")
+    parser.add_argument("--resorts-json", type=Path, default=DATA_DIR / "resorts.json", help="Path to resorts.json")
+    parser.add_argument("--dry-run", action="store_true", help="Print summary, don't write the cache")
+    parser.add_argument("--resample", action="store_true", help="Ignore cached DEM samples")
+    args = parser.parse_args()
+
+    if not HAS_NUMPY:
+        parser.error("numpy is required (pip install numpy)")
+
+    print("=== Resort Elevation Fixer ===")
+    if not args.dem_dir.exists():
+        print(f"Error: DEM directory {args.dem_dir} not found")
+        return
+
+    with open(args.resorts_json, 'r', encoding='utf-8') as f:
+        resorts = [r for r in json.load(f) if r.get('lat') and r.get('lon')]
+    print(f"Loaded {len(resorts)} resorts from {args.resorts_json}")
+
+    cache = {} if args.resample else load_elevation_cache()
+    dem_samples = cache.get('dem_samples', {})
+    if dem_samples and cache.get('summit_method') != SUMMIT_METHOD:
+        # Summits from the single-tile window were clipped at tile borders
+        for entry in dem_samples.values():
+            entry.pop('summit', None)
+    centers = [(r['lat'], r['lon']) for r in resorts]
+    points = [
+        (r['primaryAccessPoint']['lat'], r['primaryAccessPoint']['lon'])
+        for r in resorts
+        if r.get('primaryAccessPoint') and r['primaryAccessPoint'].get('lat') and r['primaryAccessPoint'].get('lon')
+    ]
+    sampled = sample_missing(HgtDem(args.dem_dir), dem_samples, centers, points)
+    print(f"DEM samples: {sampled} new, {len(dem_samples) - sampled} cached")
+
+    corrections = compute_corrections(resorts, dem_samples)
+
+    flag_counts = {}
+    for entry in corrections.values():
+        for flag in entry['flags']:
+            flag_counts[flag] = flag_counts.get(flag, 0) + 1
+    changed = sum(1 for e in corrections.values() if e['flags'])
+    print(f"Resorts with corrections: {changed}/{len(corrections)}")
+    for flag, count in sorted(flag_counts.items()):
+        print(f"  {flag}: {count}")
+
+    if args.dry_run:
+        return
+
+    output = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "source": f"DEM ({args.dem_dir.name})",
+        "summit_method": SUMMIT_METHOD,
+        "elevations": corrections,
+        "dem_samples": dem_samples,
+    }
+    write_json_atomic(CACHE_PATH, output, indent=1)
+    print(f"Exported to {CACHE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Long-running forecast refresh daemon (self-hosted alternative to the cron workflow).
+
+The GitHub Actions workflow cold-starts three times a day and refetches
+everything whether or not the providers have published anything new.
+This daemon keeps all state in memory and refreshes when the providers do:
+
+- Resorts (with DEM-corrected elevations), the last Open-Meteo and GeoSphere
+  forecasts and the GeoSphere hourly request budget stay in memory.
+  resorts.json / resort_elevations.json are reloaded when they change.
+- Open-Meteo: polls the model metadata (meta.json) and refetches all
+  resorts once a new run is available. Sleeps until the next expected run.
+- GeoSphere: polls the dataset metadata (last_forecast_reftime). After a
+  new run, resorts are refreshed in priority order (fetch_geosphere_forecast
+  --priority scoring) within the rolling hourly budget; the rest follow as
+  the budget frees up.
+- Without metadata (API error), falls back to fixed refresh intervals.
+- After each refresh the blended product is rebuilt; all outputs are
+  written atomically (temp file + rename), so the web server never serves
+  a half-written file.
+
+Usage:
+    python forecast_daemon.py [--once] [--poll-interval S] [--gs-budget N] [--models M1,M2,...]
+
+Output:
+    data/forecasts/openmeteo_forecast.json
+    data/forecasts/current_forecast.json
+    data/forecasts/blended_forecast.json
+"""
+
+import argparse
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import requests
+
+import build_blended_forecast as blended
+import fetch_geosphere_forecast as geosphere
+import fetch_openmeteo_forecast as openmeteo
+
+# ==============================================================================
+# Configuration
+# ==============================================================================
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+FORECAST_DIR = DATA_DIR / "forecasts"
+RESORT_FILES = [DATA_DIR / "resorts.json", DATA_DIR / "resort_elevations.json"]
+
+# Open-Meteo: run availability per model (any new run triggers a refresh)
+OPENMETEO_META_URL = "https://api.open-meteo.com/data/{model}/static/meta.json"
+OPENMETEO_META_MODELS = ["dwd_icon", "ecmwf_ifs025"]
+OPENMETEO_FALLBACK_H = 6.0     # Refresh interval without metadata
+
+# GeoSphere: reference time of the latest model run
+GEOSPHERE_METADATA_URL = f"{geosphere.GEOSPHERE_BASE_URL}/timeseries/forecast/{geosphere.DATASET}/metadata"
+GEOSPHERE_FALLBACK_H = 3.0     # Refresh interval without metadata
+GEOSPHERE_BUDGET_WINDOW_S = 3600
+
+POLL_INTERVAL_S = 600          # Metadata poll interval
+MIN_SLEEP_S = 60
+METADATA_TIMEOUT_S = 15
+
+
+def log(message: str):
+    """Print with UTC timestamp (daemon output goes to journald/docker logs)."""
+    print(f"[{datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+def parse_iso(value: str | None) -> datetime | None:
+    """Parse an ISO timestamp (None on missing/invalid)."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        return None
+
+
+# ==============================================================================
+# Provider Metadata
+# ==============================================================================
+
+def get_openmeteo_runs(models: list) -> tuple[dict, datetime | None] | None:
+    """
+    Latest run availability of the Open-Meteo models.
+
+    Returns:
+        Tuple of ({model: availability datetime}, next expected availability),
+        or None if no model metadata could be fetched.
+    """
+    runs = {}
+    next_runs = []
+    for model in models:
+        try:
+            response = requests.get(OPENMETEO_META_URL.format(model=model), timeout=METADATA_TIMEOUT_S)
+            response.raise_for_status()
+            meta = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log(f"Open-Meteo metadata for {model} failed: {e}")
+            continue
+        available = meta.get('last_run_availability_time')
+        if available is None:
+            continue
+        runs[model] = datetime.fromtimestamp(available, timezone.utc)
+        if meta.get('update_interval_seconds'):
+            next_runs.append(runs[model] + timedelta(seconds=meta['update_interval_seconds']))
+    if not runs:
+        return None
+    return runs, min(next_runs) if next_runs else None
+
+
+def get_geosphere_reftime() -> datetime | None:
+    """Reference time of the latest GeoSphere model run (None on error)."""
+    try:
+        response = requests.get(GEOSPHERE_METADATA_URL, timeout=METADATA_TIMEOUT_S)
+        response.raise_for_status()
+        return parse_iso(response.json().get('last_forecast_reftime'))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log(f"GeoSphere metadata failed: {e}")
+        return None
+
+
+# ==============================================================================
+# Daemon
+# ==============================================================================
+
+class ForecastDaemon:
+    """In-memory refresh loop for Open-Meteo, GeoSphere and the blended product."""
+
+    def __init__(self, forecast_dir: Path = FORECAST_DIR, poll_interval: int = POLL_INTERVAL_S,
+                 gs_budget: int = geosphere.DEFAULT_HOURLY_BUDGET, models: list = None):
+        self.forecast_dir = forecast_dir
+        self.poll_interval = poll_interval
+        self.gs_budget = gs_budget
+        self.models = models
+        self.stop_event = threading.Event()
+
+        self.om_path = forecast_dir / "openmeteo_forecast.json"
+        self.gs_path = forecast_dir / "current_forecast.json"
+        self.blended_path = forecast_dir / "blended_forecast.json"
+
+        # Resorts (reloaded on file change)
+        self.resort_mtimes = None
+        self.om_resorts = []
+        self.gs_resorts = []
+        self.travel_hours = {}
+
+        # Last known forecasts
+        self.om_forecasts, self.om_generated_at = openmeteo.load_previous_forecasts(self.om_path)
+        gs_forecasts, gs_generated_at = geosphere.load_existing_forecasts(self.gs_path)
+        self.gs_forecasts = gs_forecasts
+        self.gs_generated_at = gs_generated_at.isoformat() if gs_generated_at else None
+
+        # Provider runs
+        self.om_runs = None
+        self.om_next_run = None
+        self.om_force_refresh = False
+        self.gs_reftime = None
+        self.gs_fetched_before = None   # Resorts fetched before this are due
+
+        # GeoSphere request timestamps within the rolling budget window
+        self.gs_requests = deque()
+
+    # --- Resorts -----------------------------------------------------------------
+
+    def reload_resorts_if_changed(self) -> bool:
+        """Reload resorts when resorts.json or the elevation corrections changed."""
+        mtimes = tuple(p.stat().st_mtime if p.exists() else None for p in RESORT_FILES)
+        if mtimes == self.resort_mtimes:
+            return False
+        self.om_resorts = openmeteo.get_resorts_from_json(RESORT_FILES[0])
+        gs_resorts = geosphere.get_resorts_from_json(RESORT_FILES[0], countries=geosphere.COVERED_COUNTRIES)
+        self.gs_resorts = [r for r in gs_resorts if geosphere.is_in_geosphere_coverage(r['lat'], r['lon'])]
+        self.travel_hours = geosphere.load_best_travel_hours(DATA_DIR)
+        log(f"Loaded {len(self.om_resorts)} resorts ({len(self.gs_resorts)} in GeoSphere coverage)")
+        if self.resort_mtimes is not None:
+            # New resorts / elevations: Open-Meteo refetches all (GeoSphere picks
+            # up resorts without data by itself)
+            self.om_force_refresh = True
+        self.resort_mtimes = mtimes
+        return True
+
+    # --- Open-Meteo --------------------------------------------------------------
+
+    def openmeteo_due(self, now: datetime) -> bool:
+        """New Open-Meteo run available (or fallback interval elapsed)?"""
+        result = get_openmeteo_runs(OPENMETEO_META_MODELS)
+        if self.om_force_refresh:
+            self.om_force_refresh = False
+            if result is not None:
+                self.om_runs, self.om_next_run = result
+            return True
+        if result is None:
+            self.om_next_run = None
+            generated_at = parse_iso(self.om_generated_at)
+            return generated_at is None or now - generated_at > timedelta(hours=OPENMETEO_FALLBACK_H)
+        runs, self.om_next_run = result
+        if runs == self.om_runs:
+            return False
+        if self.om_runs is None:
+            # Startup: existing data newer than every run is still current
+            generated_at = parse_iso(self.om_generated_at)
+            if generated_at is not None and generated_at > max(runs.values()) and self.om_forecasts:
+                self.om_runs = runs
+                return False
+        self.om_runs = runs
+        return True
+
+    def refresh_openmeteo(self):
+        """Refetch all resorts, carrying forward the last good data for failures."""
+        log("Refreshing Open-Meteo")
+        forecasts = openmeteo.fetch_mountain_valley(self.om_resorts, self.models)
+        carried = openmeteo.carry_forward_forecasts(forecasts, self.om_resorts, self.om_forecasts, self.om_generated_at)
+        if carried:
+            log(f"Carried forward {carried} stale Open-Meteo forecasts")
+        if not forecasts:
+            return False
+        self.om_forecasts = forecasts
+        openmeteo.export_forecasts_to_json(forecasts, self.om_path)
+        self.om_generated_at = datetime.now(timezone.utc).isoformat()
+        return True
+
+    # --- GeoSphere ---------------------------------------------------------------
+
+    def gs_budget_left(self, now_ts: float) -> int:
+        """Requests left in the rolling hourly window."""
+        while self.gs_requests and now_ts - self.gs_requests[0] >= GEOSPHERE_BUDGET_WINDOW_S:
+            self.gs_requests.popleft()
+        return max(0, self.gs_budget - len(self.gs_requests))
+
+    def update_geosphere_run(self, now: datetime):
+        """Track the GeoSphere run; a new run makes every older fetch due."""
+        reftime = get_geosphere_reftime()
+        if reftime is None:
+            # Fallback: anything older than the fixed interval is due
+            self.gs_fetched_before = now - timedelta(hours=GEOSPHERE_FALLBACK_H)
+            return
+        if reftime == self.gs_reftime:
+            return
+        if self.gs_reftime is None:
+            # Startup: only fetches before the reference time are certainly older
+            self.gs_fetched_before = reftime
+        else:
+            log(f"New GeoSphere run {reftime.isoformat()}")
+            self.gs_fetched_before = now
+        self.gs_reftime = reftime
+
+    def refresh_geosphere(self, now: datetime) -> bool:
+        """Fetch due resorts in priority order within the remaining hourly budget."""
+        generated_at = parse_iso(self.gs_generated_at)
+        self.gs_forecasts = {
+            sid: entry for sid, entry in self.gs_forecasts.items()
+            if (geosphere.get_forecast_age_hours(entry, generated_at, now) or 0) < geosphere.FORECAST_HORIZON_H
+        }
+        due = geosphere.prioritize_resorts(
+            self.gs_resorts, self.gs_forecasts, generated_at, GEOSPHERE_FALLBACK_H, DATA_DIR,
+            fetched_before=self.gs_fetched_before, travel_hours=self.travel_hours
+        )
+        budget = self.gs_budget_left(time.time())
+        if not due or not budget:
+            if due:
+                log(f"GeoSphere: {len(due)} resorts due, hourly budget exhausted")
+            return False
+
+        batches = [due[i:i + geosphere.BATCH_SIZE] for i in range(0, len(due), geosphere.BATCH_SIZE)]
+        log(f"Refreshing GeoSphere: {len(due)} resorts due, {len(batches)} batches (budget left: {budget})")
+        updated = 0
+        for batch in batches:
+            # Retries count against the budget as well
+            budget = self.gs_budget_left(time.time())
+            if self.stop_event.is_set() or not budget:
+                break
+            data = geosphere.fetch_forecast_batch(
+                [(r['lat'], r['lon']) for r in batch],
+                on_request=lambda: self.gs_requests.append(time.time()),
+                max_retries=min(geosphere.MAX_RETRIES, budget - 1),
+            )
+            results = geosphere.parse_geosphere_batch_response(data, batch) if data else {}
+            self.gs_forecasts.update(results)
+            updated += len(results)
+            time.sleep(geosphere.REQUEST_DELAY_S)
+
+        log(f"GeoSphere: {updated} resorts updated")
+        if not updated:
+            return False
+        geosphere.export_forecasts_to_json(self.gs_forecasts, self.gs_path)
+        self.gs_generated_at = datetime.now(timezone.utc).isoformat()
+        return True
+
+    # --- Blended -----------------------------------------------------------------
+
+    def rebuild_blended(self):
+        """Rebuild blended_forecast.json from the in-memory forecasts."""
+        output = blended.build_blended_output(
+            self.gs_forecasts, self.gs_generated_at, self.om_forecasts, self.om_generated_at
+        )
+        blended.write_json_atomic(self.blended_path, output, separators=(',', ':'))
+        log(f"Blended {len(output['forecasts'])} resorts")
+
+    # --- Loop --------------------------------------------------------------------
+
+    def run_cycle(self):
+        """One poll: reload resorts, refresh providers with new data, rebuild."""
+        self.reload_resorts_if_changed()
+        now = datetime.now(timezone.utc)
+
+        changed = False
+        if self.openmeteo_due(now):
+            changed |= self.refresh_openmeteo()
+        self.update_geosphere_run(now)
+        changed |= self.refresh_geosphere(now)
+
+        if changed:
+            self.rebuild_blended()
+
+    def seconds_until_next_cycle(self) -> float:
+        """Sleep until the next expected run, budget refill or poll interval."""
+        now_ts = time.time()
+        wake = [now_ts + self.poll_interval]
+        if self.om_next_run is not None:
+            wake.append(self.om_next_run.timestamp())
+        if self.gs_requests and self.gs_budget_left(now_ts) == 0:
+            wake.append(self.gs_requests[0] + GEOSPHERE_BUDGET_WINDOW_S)
+        return max(MIN_SLEEP_S, min(wake) - now_ts)
+
+    def run(self):
+        """Loop until SIGINT/SIGTERM."""
+        while not self.stop_event.is_set():
+            try:
+                self.run_cycle()
+            except Exception as e:
+                # Keep the daemon alive; the next cycle retries
+                log(f"Cycle failed: {e!r}")
+            sleep_s = self.seconds_until_next_cycle()
+            log(f"Sleeping {sleep_s / 60:.0f} min")
+            self.stop_event.wait(sleep_s)
+        log("Stopped")
+
+
+# ==============================================================================
+# Main
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running forecast refresh daemon")
+    parser.add_argument("--once", action="store_true", help="Run a single cycle and exit")
+    parser.add_argument("--poll-interval", type=int, default=POLL_INTERVAL_S, help=f"Metadata poll interval in seconds (default: {POLL_INTERVAL_S})")
+    parser.add_argument("--gs-budget", type=int, default=geosphere.DEFAULT_HOURLY_BUDGET, help=f"GeoSphere requests per hour (API limit: {geosphere.GEOSPHERE_HOURLY_BUDGET})")
+    parser.add_argument("--models", help="Open-Meteo ensemble models, comma-separated (requires numpy)")
+    args = parser.parse_args()
+
+    if args.gs_budget > geosphere.GEOSPHERE_HOURLY_BUDGET:
+        parser.error(f"--gs-budget cannot exceed {geosphere.GEOSPHERE_HOURLY_BUDGET}")
+    models = [m.strip() for m in args.models.split(",") if m.strip()] if args.models else None
+    if models and not [m for m in models if m != openmeteo.DEFAULT_MODEL]:
+        parser.error(f"--models needs at least one model besides {openmeteo.DEFAULT_MODEL}")
+    if models and not openmeteo.HAS_NUMPY:
+        parser.error("--models requires numpy (pip install numpy)")
+
+    FORECAST_DIR.mkdir(exist_ok=True)
+    daemon = ForecastDaemon(FORECAST_DIR, args.poll_interval, args.gs_budget, models)
+
+    log("=== Forecast Daemon ===")
+    if args.once:
+        daemon.run_cycle()
+        return
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: daemon.stop_event.set())
+    daemon.run()
+
+
+if __name__ == "__main__":
+    main()
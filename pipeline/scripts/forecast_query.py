@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Local query service (HTTP + CLI) over the forecast outputs and travel times.
+
+Alerting and trip planning scripts otherwise load and scan the full JSON
+files. This keeps blended_forecast.json, the travel time matrix, resorts.json
+and verbuende.json in memory with indexes:
+
+- by stable_id, country and Verbund (verbuende.json members)
+- by travel time bucket per home (TRAVEL_BUCKET_H wide)
+- per snow window/elevation a sorted value list for threshold/range queries
+
+Results are cached (LRU, CACHE_SIZE entries). Index and cache are rebuilt
+when one of the source files changes (checked per query via mtime/size),
+e.g. after the next forecast run.
+
+Usage:
+    # Resorts within 3 h of muc with >= 20 cm in 48 h
+    python forecast_query.py query --home muc --max-hours 3 --window 48h --min-snow 20
+
+    # Alerting: exit status 0 if any match, 1 if none
+    python forecast_query.py query --verbund stubai --window 3d --min-snow 30 && notify-send ...
+
+    # HTTP: GET /query?home=muc&max_hours=3&window=48h&min_snow=20, /resort/<stable_id>, /health
+    python forecast_query.py serve [--port 8765]
+
+Input:
+    data/forecasts/blended_forecast.json (build_blended_forecast.py)
+    data/travel_times/matrix.json + matrix.bin (build_travel_time_matrix.py)
+    data/resorts.json, data/verbuende.json
+"""
+
+import argparse
+import json
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from build_travel_time_matrix import load_travel_time_matrix
+
+# ==============================================================================
+# Configuration
+# ==============================================================================
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+BLENDED_PATH = DATA_DIR / "forecasts" / "blended_forecast.json"
+TRAVEL_TIMES_DIR = DATA_DIR / "travel_times"
+SOURCE_FILES = [
+    BLENDED_PATH,
+    TRAVEL_TIMES_DIR / "matrix.json",
+    TRAVEL_TIMES_DIR / "matrix.bin",
+    DATA_DIR / "resorts.json",
+    DATA_DIR / "verbuende.json",
+]
+
+TRAVEL_BUCKET_H = 1.0     # Travel time index granularity
+CACHE_SIZE = 256          # Cached query results
+DEFAULT_PORT = 8765
+DEFAULT_LIMIT = 50
+ELEVATIONS = ("mountain", "valley")
+
+# Query parameters: name -> converter (shared by HTTP and CLI)
+QUERY_PARAMS = {
+    "resort": str,         # stable_id (comma-separated)
+    "country": str,        # e.g. AT (comma-separated)
+    "verbund": str,        # Verbund stable_id or name (comma-separated)
+    "home": str,           # Home id for travel time filters/columns
+    "min_hours": float,
+    "max_hours": float,
+    "window": str,         # Snow window, e.g. 48h, 3d (default: first window)
+    "elevation": str,      # mountain (default) or valley
+    "min_snow": float,     # cm
+    "max_snow": float,     # cm
+    "glacier": bool,
+    "limit": int,
+}
+
+
+def parse_bool(value) -> bool:
+    """Parse 1/true/yes (HTTP query strings)."""
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def split_list(value: str | None) -> list | None:
+    """'a,b' -> ['a', 'b'] (None stays None)."""
+    if value is None:
+        return None
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+# ==============================================================================
+# Index
+# ==============================================================================
+
+class ForecastIndex:
+    """In-memory indexes over one snapshot of the source files."""
+
+    def __init__(self, resorts: list, verbuende: list, blended: dict, matrix: dict | None):
+        self.generated_at = blended.get('generated_at')
+        self.windows = blended.get('windows', [])
+        forecasts = blended.get('forecasts', {})
+
+        self.by_id = {}
+        self.by_country = {}
+        for r in resorts:
+            stable_id = r.get('stable_id')
+            if not stable_id:
+                continue
+            self.by_id[stable_id] = {
+                'stable_id': stable_id,
+                'name': r.get('name'),
+                'country': r.get('country'),
+                'glacier': bool(r.get('glacier')),
+                'forecast': forecasts.get(stable_id),
+            }
+            self.by_country.setdefault(r.get('country'), set()).add(stable_id)
+
+        # Verbund id and lowercase name -> member stable_ids
+        self.by_verbund = {}
+        for v in verbuende:
+            members = {m['stable_id'] for m in v.get('members', []) if m.get('stable_id') in self.by_id}
+            for key in (v.get('stable_id'), (v.get('name') or '').lower()):
+                if key:
+                    self.by_verbund.setdefault(key, set()).update(members)
+
+        # Home -> {stable_id: hours} and bucket -> stable_ids
+        self.travel_hours = {}
+        self.travel_buckets = {}
+        if matrix:
+            n = len(matrix['resorts'])
+            for h, home_id in enumerate(matrix['homes']):
+                hours = {}
+                buckets = {}
+                for i, stable_id in enumerate(matrix['resorts']):
+                    sec = matrix['seconds'][h * n + i]
+                    # duration 0 = no route found (matrices built before it was MISSING)
+                    if sec in (0, matrix['missing']) or stable_id not in self.by_id:
+                        continue
+                    hours[stable_id] = sec / 3600
+                    buckets.setdefault(int(hours[stable_id] // TRAVEL_BUCKET_H), set()).add(stable_id)
+                self.travel_hours[home_id] = hours
+                self.travel_buckets[home_id] = buckets
+
+        # (elevation, window) -> (sorted values, stable_ids in the same order)
+        self.snow_sorted = {}
+        for elevation in ELEVATIONS:
+            for w, window in enumerate(self.windows):
+                pairs = sorted(
+                    (entry[elevation]['snow'][w], stable_id)
+                    for stable_id, entry in forecasts.items()
+                    if stable_id in self.by_id and (entry.get(elevation) or {}).get('snow')
+                    and entry[elevation]['snow'][w] is not None
+                )
+                self.snow_sorted[(elevation, window)] = ([p[0] for p in pairs], [p[1] for p in pairs])
+
+    def ids_in_travel_range(self, home: str, min_hours: float | None, max_hours: float | None) -> set:
+        """Resorts with a route from home within [min_hours, max_hours] (bucket lookup + edge check)."""
+        hours = self.travel_hours[home]
+        lo = int((min_hours or 0) // TRAVEL_BUCKET_H)
+        hi = int(max_hours // TRAVEL_BUCKET_H) if max_hours is not None else max(self.travel_buckets[home], default=0)
+        result = set()
+        for bucket in range(lo, hi + 1):
+            ids = self.travel_buckets[home].get(bucket, ())
+            if bucket in (lo, hi):
+                # Edge buckets are only partly inside the range
+                ids = {
+                    sid for sid in ids
+                    if (min_hours is None or hours[sid] >= min_hours)
+                    and (max_hours is None or hours[sid] <= max_hours)
+                }
+            result.update(ids)
+        return result
+
+    def ids_in_snow_range(self, elevation: str, window: str, min_snow: float | None, max_snow: float | None) -> set:
+        """Resorts with a snow sum within [min_snow, max_snow] (binary search)."""
+        values, ids = self.snow_sorted[(elevation, window)]
+        start = bisect_left(values, min_snow) if min_snow is not None else 0
+        end = bisect_right(values, max_snow) if max_snow is not None else len(values)
+        return set(ids[start:end])
+
+    def query(self, params: dict) -> dict:
+        """
+        Filter resorts; all given filters must match.
+
+        Returns:
+            Dict with 'count', 'results' (sorted by snow, descending) and query metadata
+        """
+        window = params.get('window') or (self.windows[0] if self.windows else None)
+        elevation = params.get('elevation') or 'mountain'
+        home = params.get('home')
+        if window not in self.windows:
+            raise ValueError(f"unknown window '{window}' (available: {', '.join(self.windows)})")
+        if elevation not in ELEVATIONS:
+            raise ValueError(f"unknown elevation '{elevation}' (mountain or valley)")
+        if home is not None and home not in self.travel_hours:
+            raise ValueError(f"unknown home '{home}' (available: {', '.join(self.travel_hours)})")
+        if home is None and (params.get('min_hours') is not None or params.get('max_hours') is not None):
+            raise ValueError("min_hours/max_hours require home")
+
+        candidates = None
+
+        def narrow(ids):
+            nonlocal candidates
+            candidates = set(ids) if candidates is None else candidates & ids
+
+        if params.get('resort'):
+            narrow({sid for sid in split_list(params['resort']) if sid in self.by_id})
+        if params.get('country'):
+            narrow(set().union(*(self.by_country.get(c.upper(), set()) for c in split_list(params['country']))))
+        if params.get('verbund'):
+            narrow(set().union(*(
+                self.by_verbund.get(v, self.by_verbund.get(v.lower(), set())) for v in split_list(params['verbund'])
+            )))
+        if params.get('min_hours') is not None or params.get('max_hours') is not None:
+            narrow(self.ids_in_travel_range(home, params.get('min_hours'), params.get('max_hours')))
+        if params.get('min_snow') is not None or params.get('max_snow') is not None:
+            narrow(self.ids_in_snow_range(elevation, window, params.get('min_snow'), params.get('max_snow')))
+        if params.get('glacier') is not None:
+            narrow({sid for sid, r in self.by_id.items() if r['glacier'] == params['glacier']})
+        if candidates is None:
+            candidates = set(self.by_id)
+
+        w = self.windows.index(window)
+        rows = []
+        for stable_id in candidates:
+            resort = self.by_id[stable_id]
+            forecast = resort['forecast'] or {}
+            loc = forecast.get(elevation) or {}
+            rows.append({
+                'stable_id': stable_id,
+                'name': resort['name'],
+                'country': resort['country'],
+                'snow_cm': loc['snow'][w] if loc.get('snow') else None,
+                'elevation_m': loc.get('elevation_m'),
+                'min_temp': forecast.get('min_temp'),
+                'snow_limit_m': forecast.get('snow_limit_m'),
+                'travel_hours': round(self.travel_hours[home][stable_id], 2)
+                if home is not None and stable_id in self.travel_hours[home] else None,
+            })
+        rows.sort(key=lambda row: (row['snow_cm'] is None, -(row['snow_cm'] or 0), row['stable_id']))
+
+        limit = params.get('limit') or DEFAULT_LIMIT
+        return {
+            'generated_at': self.generated_at,
+            'window': window,
+            'elevation': elevation,
+            'count': len(rows),
+            'results': rows[:limit],
+        }
+
+    def resort(self, stable_id: str) -> dict | None:
+        """Full blended entry + travel times for one resort."""
+        resort = self.by_id.get(stable_id)
+        if resort is None:
+            return None
+        return dict(resort, windows=self.windows, travel_hours={
+            home: round(hours[stable_id], 2) for home, hours in self.travel_hours.items() if stable_id in hours
+        })
+
+
+def load_index() -> ForecastIndex:
+    """Build the index from the current source files."""
+    if not BLENDED_PATH.exists():
+        raise FileNotFoundError(f"{BLENDED_PATH} not found (run build_blended_forecast.py)")
+    with open(DATA_DIR / "resorts.json", 'r', encoding='utf-8') as f:
+        resorts = json.load(f)
+    verbuende_path = DATA_DIR / "verbuende.json"
+    verbuende = []
+    if verbuende_path.exists():
+        with open(verbuende_path, 'r', encoding='utf-8') as f:
+            verbuende = json.load(f)
+    with open(BLENDED_PATH, 'r', encoding='utf-8') as f:
+        blended = json.load(f)
+    return ForecastIndex(resorts, verbuende, blended, load_travel_time_matrix(TRAVEL_TIMES_DIR))
+
+
+# ==============================================================================
+# Service (index + LRU cache, reloaded on file change)
+# ==============================================================================
+
+class ForecastQueryService:
+    """Thread-safe query entry point shared by the HTTP handler and the CLI."""
+
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.signature = None
+        self.index = None
+
+    def get_signature(self) -> tuple:
+        """(mtime_ns, size) of every source file; changes when a new file lands."""
+        return tuple(
+            (p.stat().st_mtime_ns, p.stat().st_size) if p.exists() else None
+            for p in SOURCE_FILES
+        )
+
+    def get_index(self) -> ForecastIndex:
+        """Current index; rebuilt (and cache cleared) if a source file changed."""
+        signature = self.get_signature()
+        if signature != self.signature:
+            self.index = load_index()
+            self.cache.clear()
+            self.signature = signature
+        return self.index
+
+    def query(self, params: dict) -> dict:
+        """Cached ForecastIndex.query()."""
+        key = tuple(sorted((k, v) for k, v in params.items() if v is not None))
+        with self.lock:
+            index = self.get_index()
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            result = index.query(params)
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return result
+
+    def resort(self, stable_id: str) -> dict | None:
+        with self.lock:
+            return self.get_index().resort(stable_id)
+
+    def health(self) -> dict:
+        with self.lock:
+            index = self.get_index()
+            return {"generated_at": index.generated_at, "resorts": len(index.by_id)}
+
+
+def parse_query_params(raw: dict) -> dict:
+    """Convert raw string values (query string) with QUERY_PARAMS."""
+    params = {}
+    for name, value in raw.items():
+        if name not in QUERY_PARAMS:
+            raise ValueError(f"unknown parameter '{name}'")
+        convert = parse_bool if QUERY_PARAMS[name] is bool else QUERY_PARAMS[name]
+        try:
+            params[name] = convert(value)
+        except ValueError:
+            raise ValueError(f"invalid value for {name}: '{value}'")
+    return params
+
+
+# ==============================================================================
+# HTTP
+# ==============================================================================
+
+def make_handler(service: ForecastQueryService):
+    """Request handler bound to a service instance."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, data):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                if url.path == "/query":
+                    raw = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                    self.send_json(200, service.query(parse_query_params(raw)))
+                elif url.path.startswith("/resort/"):
+                    resort = service.resort(url.path[len("/resort/"):])
+                    if resort is None:
+                        self.send_json(404, {"error": "unknown resort"})
+                    else:
+                        self.send_json(200, resort)
+                elif url.path == "/health":
+                    self.send_json(200, service.health())
+                else:
+                    self.send_json(404, {"error": "not found"})
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+            except FileNotFoundError as e:
+                self.send_json(503, {"error": str(e)})
+
+    return Handler
+
+
+# ==============================================================================
+# Main
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Query forecasts and travel times")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser("query", help="Run one query and print JSON")
+    for name, convert in QUERY_PARAMS.items():
+        flag = "--" + name.replace("_", "-")
+        if convert is bool:
+            query_parser.add_argument(flag, action=argparse.BooleanOptionalAction, default=None)
+        else:
+            query_parser.add_argument(flag, type=convert)
+
+    serve_parser = subparsers.add_parser("serve", help="Start the HTTP server")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT})")
+    args = parser.parse_args()
+
+    service = ForecastQueryService()
+
+    if args.command == "query":
+        params = {name: getattr(args, name) for name in QUERY_PARAMS}
+        try:
+            result = service.query(params)
+        except (ValueError, FileNotFoundError) as e:
+            parser.error(str(e))
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        sys.exit(0 if result['count'] else 1)
+
+    service.health()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving forecast queries on http://{args.host}:{args.port}/query")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
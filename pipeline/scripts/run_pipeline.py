@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Incremental pipeline runner: rerun only the stages whose inputs changed.
+
+Each stage declares its input and output files (globs, relative to the repo
+root). The runner hashes the inputs (SHA-256 of the content, not mtimes) and
+compares them with the hashes of the last successful run in
+data/.pipeline_state.json:
+
+- Unchanged inputs and outputs present: stage is skipped.
+- Forecast stages (max_age_h) also rerun when their output is too old.
+- Only resorts.json changed and the stage supports --only: only resorts whose
+  relevant fields (resort_fields) changed are refetched, the rest of the
+  output is kept. Removed resorts are dropped.
+- Stage order follows from the declarations (a stage waits for every stage
+  whose outputs it reads); independent stages run in parallel, e.g. the
+  forecast fetchers alongside the travel time rebuild.
+- Stages whose script is not in this repo (OSRM route scripts) or whose
+  requirements are missing (DEM tiles) are left out; downstream stages use
+  the existing files.
+
+Usage:
+    python run_pipeline.py [STAGE ...] [--force] [--dry-run] [--jobs N] [--list]
+"""
+
+import argparse
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pipeline_utils import write_json_atomic
+
+# ==============================================================================
+# Configuration
+# ==============================================================================
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+SCRIPTS_DIR = Path(__file__).parent
+STATE_PATH = ROOT_DIR / "data" / ".pipeline_state.json"
+RESORTS_INPUT = "data/resorts.json"
+
+INCREMENTAL_MAX_SHARE = 0.25   # More changed resorts than this: full stage run
+DEFAULT_JOBS = 4
+GEOSPHERE_MAX_AGE_H = 5        # --max-age of the fetcher and rerun age of its output (below the cron spacing)
+
+# Stage declarations (paths relative to the repo root)
+STAGES = [
+    {
+        "name": "routes",
+        "cmd": ["precompute_routes.js"],
+        "inputs": ["data/homes.json", "data/resorts.json"],
+        "outputs": ["data/routes/home_*.geojson"],
+    },
+    {
+        "name": "travel_times",
+        "cmd": ["build_travel_times_from_routes.js"],
+        "inputs": ["data/routes/home_*.geojson"],
+        "outputs": ["data/travel_times/home_*.json"],
+    },
+    {
+        "name": "travel_matrix",
+        "cmd": ["build_travel_time_matrix.py"],
+        "inputs": ["data/homes.json", "data/resorts.json", "data/travel_times/home_*.json"],
+        "outputs": ["data/travel_times/matrix.json", "data/travel_times/matrix.bin"],
+    },
+    {
+        "name": "elevations",
+        "cmd": ["fix_resort_elevations.py"],
+        "inputs": ["data/resorts.json", "data/dem/*.hgt"],
+        "outputs": ["data/resort_elevations.json"],
+        "requires": ["data/dem"],
+    },
+    {
+        "name": "openmeteo",
+        "cmd": ["fetch_openmeteo_forecast.py"],
+        "inputs": ["data/resorts.json", "data/resort_elevations.json"],
+        "outputs": ["data/forecasts/openmeteo_forecast.json"],
+        "resort_fields": ["lat", "lon", "minElevation", "maxElevation"],
+        "max_age_h": 6,
+    },
+    {
+        # Travel times only affect the refresh order, not the data: not an input,
+        # so GeoSphere runs alongside the travel time stages
+        "name": "geosphere",
+        "cmd": ["fetch_geosphere_forecast.py", "--json-only", "--priority", "--max-age", str(GEOSPHERE_MAX_AGE_H)],
+        "inputs": ["data/resorts.json"],
+        "outputs": ["data/forecasts/current_forecast.json"],
+        "resort_fields": ["lat", "lon", "country", "maxElevation"],
+        "max_age_h": GEOSPHERE_MAX_AGE_H,
+    },
+    {
+        "name": "blended",
+        "cmd": ["build_blended_forecast.py"],
+        "inputs": ["data/forecasts/current_forecast.json", "data/forecasts/openmeteo_forecast.json"],
+        "outputs": ["data/forecasts/blended_forecast.json"],
+    },
+]
+
+print_lock = threading.Lock()
+
+
+def log(stage: str, message: str):
+    """Print a line prefixed with the stage name (stages run in parallel)."""
+    with print_lock:
+        print(f"[{stage}] {message}", flush=True)
+
+
+# ==============================================================================
+# Hashing
+# ==============================================================================
+
+def expand(patterns: list) -> list[Path]:
+    """Existing files matching the glob patterns (sorted, relative to ROOT_DIR)."""
+    paths = set()
+    for pattern in patterns:
+        paths.update(Path(p) for p in glob.glob(str(ROOT_DIR / pattern)))
+    return sorted(p for p in paths if p.is_file())
+
+
+def hash_file(path: Path) -> str:
+    """SHA-256 of the file content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_inputs(stage: dict) -> dict:
+    """{relative path: content hash} for all existing input files."""
+    return {
+        str(path.relative_to(ROOT_DIR)): hash_file(path)
+        for path in expand(stage['inputs'])
+    }
+
+
+def resort_fingerprints(fields: list) -> dict:
+    """{stable_id: short hash of the fields a stage depends on}."""
+    with open(ROOT_DIR / RESORTS_INPUT, 'r', encoding='utf-8') as f:
+        resorts = json.load(f)
+    fingerprints = {}
+    for r in resorts:
+        if not r.get('stable_id'):
+            continue
+        values = json.dumps([r.get(field) for field in fields], sort_keys=True)
+        fingerprints[r['stable_id']] = hashlib.sha1(values.encode()).hexdigest()[:12]
+    return fingerprints
+
+
+# ==============================================================================
+# Planning
+# ==============================================================================
+
+def patterns_overlap(a: str, b: str) -> bool:
+    """True if two path globs can match the same file."""
+    return a == b or fnmatch.fnmatch(a, b) or fnmatch.fnmatch(b, a)
+
+
+def get_dependencies(stages: list) -> dict:
+    """
+    {stage name: names of stages producing one of its inputs}.
+
+    Raises:
+        ValueError: If the declarations form a cycle (no valid stage order)
+    """
+    deps = {}
+    for stage in stages:
+        deps[stage['name']] = {
+            other['name'] for other in stages
+            if other is not stage and any(
+                patterns_overlap(out, inp) for out in other['outputs'] for inp in stage['inputs']
+            )
+        }
+
+    # Depth-first search; reaching a stage already on the path closes a cycle
+    done = set()
+
+    def visit(name: str, path: list):
+        if name in done:
+            return
+        if name in path:
+            cycle = path[path.index(name):] + [name]
+            raise ValueError(f"Stage dependencies form a cycle: {' -> '.join(cycle)}")
+        for dep in sorted(deps[name]):
+            visit(dep, path + [name])
+        done.add(name)
+
+    for name in deps:
+        visit(name, [])
+    return deps
+
+
+def stage_unavailable(stage: dict) -> str | None:
+    """Reason why a stage cannot run here (missing script/requirements), else None."""
+    script = SCRIPTS_DIR / stage['cmd'][0]
+    if not script.exists():
+        return f"{script.name} not in this repository"
+    for required in stage.get('requires', []):
+        if not (ROOT_DIR / required).exists():
+            return f"{required} not found"
+    return None
+
+
+def get_output_age_hours(stage: dict) -> float | None:
+    """Age of the oldest output in hours (None if an output is missing)."""
+    oldest = None
+    for pattern in stage['outputs']:
+        paths = expand([pattern])
+        if not paths:
+            return None
+        mtime = min(p.stat().st_mtime for p in paths)
+        oldest = mtime if oldest is None else min(oldest, mtime)
+    return (datetime.now(timezone.utc).timestamp() - oldest) / 3600
+
+
+def decide(stage: dict, previous: dict | None, force: bool) -> dict:
+    """
+    Decide whether (and how) a stage runs.
+
+    Returns:
+        Dict with 'run' (bool), 'reason', 'inputs' (current hashes),
+        'resorts' (fingerprints, resort_fields stages only) and 'only'
+        (stable_ids for an incremental run, None = full run)
+    """
+    inputs = hash_inputs(stage)
+    fields = stage.get('resort_fields')
+    fingerprints = resort_fingerprints(fields) if fields else None
+    plan = {'run': True, 'inputs': inputs, 'resorts': fingerprints, 'only': None}
+
+    age = get_output_age_hours(stage)
+    if force:
+        plan['reason'] = "forced"
+    elif previous is None:
+        plan['reason'] = "no previous run"
+    elif age is None:
+        plan['reason'] = "output missing"
+    elif stage.get('max_age_h') and age > stage['max_age_h']:
+        plan['reason'] = f"output {age:.1f}h old (max {stage['max_age_h']}h)"
+    else:
+        changed = sorted(path for path in set(inputs) | set(previous['inputs'])
+                         if inputs.get(path) != previous['inputs'].get(path))
+        if not changed:
+            plan.update(run=False, reason="inputs unchanged")
+        elif changed == [RESORTS_INPUT] and fields and previous.get('resorts') is not None:
+            old = previous['resorts']
+            only = [sid for sid, fp in fingerprints.items() if old.get(sid) != fp]
+            removed = len(set(old) - set(fingerprints))
+            if not only and not removed:
+                plan.update(run=False, reason="no relevant resort fields changed")
+            elif len(only) > INCREMENTAL_MAX_SHARE * len(fingerprints):
+                plan['reason'] = f"{len(only)} resorts changed"
+            else:
+                plan['only'] = only
+                plan['reason'] = f"{len(only)} resorts changed, {removed} removed"
+        else:
+            plan['reason'] = f"changed: {', '.join(changed[:3])}" + (" ..." if len(changed) > 3 else "")
+    return plan
+
+
+# ==============================================================================
+# Execution
+# ==============================================================================
+
+def build_command(stage: dict, only: list | None) -> list:
+    """Interpreter + script + arguments (+ --only for incremental runs)."""
+    script, *args = stage['cmd']
+    interpreter = ["node"] if script.endswith(".js") else [sys.executable]
+    cmd = interpreter + [str(SCRIPTS_DIR / script)] + args
+    if only is not None:
+        cmd += ["--only", ",".join(only)]
+    return cmd
+
+
+def run_stage(stage: dict, plan: dict) -> bool:
+    """Run a stage, streaming its output line by line. Returns success."""
+    cmd = build_command(stage, plan['only'])
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    process = subprocess.Popen(cmd, cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace')
+    for line in process.stdout:
+        log(stage['name'], line.rstrip())
+    return process.wait() == 0
+
+
+def execute(stage: dict, state: dict, force: bool, dry_run: bool, upstream_ran: bool) -> tuple[str, dict | None]:
+    """
+    Plan and run one stage.
+
+    Returns:
+        Tuple of (status, state entry): status is 'ran', 'would_run' (--dry-run),
+        'skipped', 'unavailable' or 'failed', the entry is only set after a real run
+    """
+    name = stage['name']
+    reason = stage_unavailable(stage)
+    if reason:
+        log(name, f"unavailable ({reason}), using existing outputs")
+        return 'unavailable', None
+
+    plan = decide(stage, state.get(name), force)
+    if not plan['run'] and dry_run and upstream_ran:
+        # Real runs see the new upstream outputs in the input hashes
+        plan.update(run=True, reason="upstream stage runs")
+    if not plan['run']:
+        log(name, f"skipped ({plan['reason']})")
+        return 'skipped', None
+
+    mode = f"{len(plan['only'])} resorts" if plan['only'] is not None else "full"
+    log(name, f"{'would run' if dry_run else 'running'} ({mode}): {plan['reason']}")
+    if dry_run:
+        return 'would_run', None
+    if not run_stage(stage, plan):
+        log(name, "FAILED")
+        return 'failed', None
+
+    return 'ran', {
+        'inputs': plan['inputs'],
+        'resorts': plan['resorts'],
+        'finished_at': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def run_pipeline(stages: list, state: dict, jobs: int, force: bool, dry_run: bool) -> dict:
+    """
+    Run stages in dependency order, independent stages in parallel.
+
+    A failed stage blocks everything downstream. The state is saved after
+    every successful stage, so an interrupted run keeps finished work.
+
+    Returns:
+        {stage name: status}
+    """
+    deps = get_dependencies(stages)
+    names = {s['name'] for s in stages}
+    status = {}
+    pending = {s['name']: s for s in stages}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                stage_deps = deps[name] & names
+                if any(status.get(d) in ('failed', 'blocked') for d in stage_deps):
+                    log(name, "blocked (upstream stage failed)")
+                    status[name] = 'blocked'
+                    del pending[name]
+                elif all(d in status for d in stage_deps):
+                    upstream_ran = any(status[d] in ('ran', 'would_run') for d in stage_deps)
+                    running[pool.submit(execute, stage, state, force, dry_run, upstream_ran)] = name
+                    del pending[name]
+            if not running:
+                # Unreachable with acyclic dependencies (checked in get_dependencies)
+                raise RuntimeError(f"No runnable stage among: {', '.join(sorted(pending))}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    status[name], entry = future.result()
+                except Exception as e:
+                    log(name, f"FAILED: {e!r}")
+                    status[name], entry = 'failed', None
+                if entry is not None:
+                    state[name] = entry
+                    write_json_atomic(STATE_PATH, state, indent=2)
+    return status
+
+
+def load_state() -> dict:
+    """Hashes of the last successful run per stage."""
+    if not STATE_PATH.exists():
+        return {}
+    with open(STATE_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# ==============================================================================
+# Main
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the data pipeline incrementally")
+    parser.add_argument("stages", nargs="*", help="Stages to consider (default: all)")
+    parser.add_argument("--force", action="store_true", help="Run the selected stages regardless of hashes")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would run")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help=f"Parallel stages (default: {DEFAULT_JOBS})")
+    parser.add_argument("--list", action="store_true", help="List stages and dependencies")
+    args = parser.parse_args()
+
+    deps = get_dependencies(STAGES)
+    if args.list:
+        for stage in STAGES:
+            after = ", ".join(sorted(deps[stage['name']])) or "-"
+            print(f"{stage['name']:<14} after: {after:<28} {stage_unavailable(stage) or ''}")
+        return
+
+    unknown = set(args.stages) - {s['name'] for s in STAGES}
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    stages = [s for s in STAGES if not args.stages or s['name'] in args.stages]
+
+    print("=== Pipeline Runner ===")
+    status = run_pipeline(stages, load_state(), args.jobs, args.force, args.dry_run)
+
+    print()
+    print("=== Done ===")
+    for stage in stages:
+        print(f"  {stage['name']:<14} {status.get(stage['name'])}")
+    if any(s in ('failed', 'blocked') for s in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()